@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+Measures the cold start of the monitor: how long importing medwatch takes in a
+fresh interpreter (from python -X importtime), the peak memory it adds, and
+which modules it pulls in. The data-prep dependencies (pandas,
+pandas_datareader, yahooquery, googlesearch) should only be imported when a
+data-prep function is called, never by the monitor.
+
+    python bench_import.py                        # report
+    python bench_import.py --check                # exit 1 if data-prep deps are imported
+    python bench_import.py --check --max-ms 400 --max-rss-mb 60
+
+Each module is imported --repeat times in new interpreters, the fastest kept.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+DIR_PYTHON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = ["medwatch", "medwatch.runner"]  # What a monitor process imports
+
+HEAVY = ["pandas", "pandas_datareader", "yahooquery", "googlesearch", "numpy"]
+
+RSS_SCRIPT = (
+    "import resource, sys; {imports}"
+    "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def peak_rss_mb(module=None):
+    """
+    Peak memory of a new interpreter after importing module (None imports nothing)
+
+    Returns:
+    -------------
+    rss_mb: float
+    """
+
+    imports = "" if module is None else f"import {module}; "
+    output = subprocess.run(
+        [sys.executable, "-c", RSS_SCRIPT.format(imports=imports)],
+        cwd=DIR_PYTHON,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    rss = int(output.strip().splitlines()[-1])
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def import_times(module):
+    """
+    Import time of module and of everything it imports, in a new interpreter
+
+    Parameters:
+    -------------
+    module: str - Module to import
+
+    Returns:
+    -------------
+    times: dict - Module name -> (self ms, cumulative ms), in import order
+    """
+
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=DIR_PYTHON,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+
+    return times
+
+
+def profile(module, repeat=5):
+    """
+    Fastest of repeat imports of module, see import_times()
+
+    Returns:
+    -------------
+    total_ms: float - Cumulative import time of module
+    times: dict - See import_times(), of the fastest import
+    """
+
+    best = None
+    for _ in range(repeat):
+        times = import_times(module)
+        if best is None or times[module][1] < best[module][1]:
+            best = times
+
+    return best[module][1], best
+
+
+def report(module, total_ms, times, rss_mb, top=10):
+    """
+    Formats the import time, memory and slowest imports of module
+
+    Returns:
+    -------------
+    report: str
+    """
+
+    heavy = [name for name in HEAVY if name in times]
+    lines = [
+        f"{module}: {total_ms:.1f} ms, +{rss_mb:.1f} MB peak RSS, "
+        f"{len(times)} modules imported",
+        f"  data-prep dependencies imported: {', '.join(heavy) or 'none'}",
+        f"  {'self ms':>9}{'cumul. ms':>11}  module",
+    ]
+
+    slowest = sorted(times.items(), key=lambda item: -item[1][0])[:top]
+    for name, (self_ms, cumulative_ms) in slowest:
+        lines.append(f"  {self_ms:9.1f}{cumulative_ms:11.1f}  {name}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="imports timed (best kept)"
+    )
+    parser.add_argument("--top", type=int, default=10, help="slowest imports listed")
+    parser.add_argument(
+        "--check", action="store_true", help="exit 1 if a limit is exceeded"
+    )
+    parser.add_argument("--max-ms", type=float, help="import time limit with --check")
+    parser.add_argument(
+        "--max-rss-mb", type=float, help="added memory limit with --check"
+    )
+    args = parser.parse_args()
+
+    baseline_mb = peak_rss_mb()
+    print(
+        f"Python {sys.version.split()[0]}, bare interpreter {baseline_mb:.1f} MB peak RSS\n"
+    )
+
+    failures = []
+    for module in args.modules:
+        total_ms, times = profile(module, repeat=args.repeat)
+        rss_mb = peak_rss_mb(module) - baseline_mb
+        print(report(module, total_ms, times, rss_mb, top=args.top) + "\n")
+
+        heavy = [name for name in HEAVY if name in times]
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)}")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            failures.append(
+                f"{module} takes {total_ms:.1f} ms to import (> {args.max_ms})"
+            )
+        if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+            failures.append(f"{module} adds {rss_mb:.1f} MB (> {args.max_rss_mb})")
+
+    if args.check:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1 if failures else 0)
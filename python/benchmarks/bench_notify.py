@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+"""
+Exercises the email delivery path (NotificationQueue over an EmailDispatcher)
+against a local SMTP sink, fully offline, and reports the delivery stats:
+
+    burst      a burst of emails, all delivered and removed from the spool
+    slow       the same burst to a server taking --latency seconds per email
+    retry      the first deliveries are refused (451) and retried
+    give up    every delivery is refused, emails end up in spool/failed/
+    restart    emails spooled by a queue that was never started are delivered
+               by the next one
+    digest     emails held in digest mode go out as one email per recipient group
+
+    python bench_notify.py                        # 200 emails per burst
+    python bench_notify.py --emails 1000 --latency 0.01
+
+The sink speaks just enough SMTP for smtplib (no TLS or login) and listens on
+a free port. Exits 1 if any scenario does not behave as expected.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import socketserver
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import medwatch as mw
+
+SENDER = "medwatch@localhost"
+
+
+# LOCAL SMTP SINK
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    One SMTP session: accepts HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP and QUIT
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.n_connections += 1
+
+        self.reply("220 medwatch-sink ESMTP")
+        mail_from, rcpt_tos = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode("utf-8", errors="replace").strip()
+            verb = command[:4].upper()
+
+            if verb == "EHLO":
+                self.wfile.write(b"250-medwatch-sink\r\n250 8BITMIME\r\n")
+            elif verb == "HELO":
+                self.reply("250 medwatch-sink")
+            elif verb == "MAIL":
+                mail_from, rcpt_tos = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_tos.append(command[8:].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line[1:] if line.startswith(b"..") else line)
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server.refuse():
+                    self.reply("451 Temporary failure, try again later")
+                else:
+                    server.receive(mail_from, rcpt_tos, b"".join(data))
+                    self.reply("250 OK")
+                mail_from, rcpt_tos = None, []
+            elif verb == "RSET":
+                mail_from, rcpt_tos = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server that keeps the emails it receives in memory
+
+    e.g. with SMTPSink() as sink:
+             threading.Thread(target=sink.serve_forever, daemon=True).start()
+             EmailDispatcher(address, None, host='127.0.0.1', port=sink.port, use_ssl=False)
+
+    Parameters:
+    -------------
+    port: int = 0 - Port to listen on, 0 picks a free one (see self.port)
+    latency: float = 0 - Seconds taken to accept each email
+    refuse_first: int = 0 - Emails refused (451) before any is accepted
+    refuse_rate: float = 0 - Fraction of emails refused after those
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0, refuse_first=0, refuse_rate=0):
+        super().__init__(("127.0.0.1", port), SMTPHandler)
+        self.port = self.server_address[1]
+        self.latency = latency
+        self.refuse_first = refuse_first
+        self.refuse_rate = refuse_rate
+
+        self.lock = threading.Lock()
+        self.messages = []  # (sender, recipients, data) of every email accepted
+        self.n_connections = 0
+        self.n_refused = 0
+
+    def refuse(self):
+        with self.lock:
+            refused = self.refuse_first > 0 or random.random() < self.refuse_rate
+            if self.refuse_first > 0:
+                self.refuse_first -= 1
+            if refused:
+                self.n_refused += 1
+
+        return refused
+
+    def receive(self, sender, recipients, data):
+        with self.lock:
+            self.messages.append((sender, recipients, data))
+
+
+# SCENARIOS
+
+
+def start_sink(**kwargs):
+    sink = SMTPSink(**kwargs)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    return sink
+
+
+def notification_queue(sink, spool_path, **kwargs):
+    """
+    NotificationQueue delivering to sink, with retries fast enough to bench
+    """
+
+    dispatcher = mw.EmailDispatcher(
+        SENDER, None, host="127.0.0.1", port=sink.port, use_ssl=False, timeout=5
+    )
+    settings = {"backoff": 0.05, "max_backoff": 0.2}
+    settings.update(kwargs)
+
+    return mw.NotificationQueue(dispatcher, spool_path=spool_path, **settings)
+
+
+def email(i):
+    return f"Subject: Medwatch update from Company{i} [bench]\n\nNew link {i}\n"
+
+
+def wait_until(condition, timeout):
+    """
+    Polls condition until it is true or timeout seconds have passed
+
+    Returns:
+    -------------
+    met: bool
+    """
+
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+
+    return True
+
+
+def spooled(spool_path, failed=False):
+    if failed:
+        spool_path = os.path.join(spool_path, "failed")
+
+    return [name for name in os.listdir(spool_path) if name.endswith(".json")]
+
+
+def burst(spool_path, n_emails, latency=0):
+    sink = start_sink(latency=latency)
+    notifications = notification_queue(sink, spool_path).start()
+
+    start = time.perf_counter()
+    for i in range(n_emails):
+        notifications.send(email(i), ["a@x", "b@x"])
+    enqueue_time = time.perf_counter() - start
+
+    delivered = wait_until(
+        lambda: notifications.stats()["sent"] == n_emails, 30 + n_emails * latency
+    )
+    wall_time = time.perf_counter() - start
+    notifications.close()
+    sink.shutdown()
+
+    failures = []
+    if not delivered or len(sink.messages) != n_emails:
+        failures.append(f"{len(sink.messages)}/{n_emails} emails received")
+    if spooled(spool_path):
+        failures.append(f"{len(spooled(spool_path))} emails left in the spool")
+
+    details = (
+        f"enqueued in {enqueue_time * 1000:.1f} ms, delivered in {wall_time:.2f}s "
+        f"({n_emails / wall_time:.0f} emails/s), {sink.n_connections} connections"
+    )
+    return notifications.stats(), details, failures
+
+
+def retry(spool_path, n_emails, refuse_first=3):
+    sink = start_sink(refuse_first=refuse_first)
+    notifications = notification_queue(sink, spool_path).start()
+
+    for i in range(n_emails):
+        notifications.send(email(i), ["a@x"])
+
+    delivered = wait_until(lambda: notifications.stats()["sent"] == n_emails, 30)
+    notifications.close()
+    sink.shutdown()
+
+    stats = notifications.stats()
+    failures = []
+    if not delivered or len(sink.messages) != n_emails:
+        failures.append(f"{len(sink.messages)}/{n_emails} emails received")
+    if stats["retries"] != refuse_first:
+        failures.append(f"{stats['retries']} retries for {refuse_first} refusals")
+    if spooled(spool_path):
+        failures.append(f"{len(spooled(spool_path))} emails left in the spool")
+
+    details = f"{sink.n_refused} refused, {stats['retries']} retries"
+    return stats, details, failures
+
+
+def give_up(spool_path, n_emails, max_attempts=3):
+    sink = start_sink(refuse_rate=1)
+    notifications = notification_queue(
+        sink, spool_path, max_attempts=max_attempts
+    ).start()
+
+    for i in range(n_emails):
+        notifications.send(email(i), ["a@x"])
+
+    gave_up = wait_until(lambda: notifications.stats()["failed"] == n_emails, 30)
+    notifications.close()
+    sink.shutdown()
+
+    stats = notifications.stats()
+    failures = []
+    if not gave_up or len(spooled(spool_path, failed=True)) != n_emails:
+        failures.append(
+            f"{len(spooled(spool_path, failed=True))}/{n_emails} emails in spool/failed"
+        )
+    if sink.n_refused != n_emails * max_attempts:
+        failures.append(f"{sink.n_refused} attempts, not {n_emails * max_attempts}")
+
+    details = f"{sink.n_refused} attempts refused, {stats['failed']} given up on"
+    return stats, details, failures
+
+
+def restart(spool_path, n_emails):
+    sink = start_sink()
+
+    # Spooled but never delivered, as if the monitor stopped
+    stopped = notification_queue(sink, spool_path)
+    for i in range(n_emails):
+        stopped.send(email(i), ["a@x"])
+    n_spooled = len(spooled(spool_path))
+
+    notifications = notification_queue(sink, spool_path).start()
+    delivered = wait_until(lambda: notifications.stats()["sent"] == n_emails, 30)
+    notifications.close()
+    sink.shutdown()
+
+    failures = []
+    if n_spooled != n_emails:
+        failures.append(f"{n_spooled}/{n_emails} emails spooled")
+    if not delivered or len(sink.messages) != n_emails:
+        failures.append(
+            f"{len(sink.messages)}/{n_emails} emails received after restart"
+        )
+
+    details = f"{n_spooled} spooled before the restart"
+    return notifications.stats(), details, failures
+
+
+def digest(spool_path, n_emails):
+    sink = start_sink()
+    notifications = notification_queue(sink, spool_path, digest=True).start()
+
+    # Two recipients get every email, a third only every other one
+    for i in range(n_emails):
+        notifications.send(email(i), ["a@x", "b@x"])
+        if i % 2 == 0:
+            notifications.send(email(i), ["c@x"])
+    n_digests = notifications.flush()
+
+    delivered = wait_until(lambda: notifications.stats()["sent"] == n_digests, 30)
+    notifications.close()
+    sink.shutdown()
+
+    failures = []
+    if n_digests != 2:
+        failures.append(f"{n_digests} digests queued, not 2")
+    if not delivered or len(sink.messages) != n_digests:
+        failures.append(f"{len(sink.messages)}/{n_digests} digests received")
+    recipients = sorted(sorted(recipients) for _, recipients, _ in sink.messages)
+    if recipients != [["a@x", "b@x"], ["c@x"]]:
+        failures.append(f"digests sent to {recipients}")
+    for _, _, data in sink.messages:
+        if not data.startswith(b"Subject: Medwatch digest:"):
+            failures.append(f"not a digest: {data[:40]!r}")
+
+    details = f"{n_emails} emails to 3 recipients in {n_digests} digests"
+    return notifications.stats(), details, failures
+
+
+def report(name, stats, details):
+    """
+    Formats the stats of a scenario
+
+    Returns:
+    -------------
+    report: str
+    """
+
+    def ms(seconds):
+        return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+    return (
+        f"{name:10s} sent {stats['sent']:5d}  retries {stats['retries']:3d}  "
+        f"failed {stats['failed']:3d}  latency p50 {ms(stats['latency_p50'])} ms  "
+        f"p95 {ms(stats['latency_p95'])} ms  max {ms(stats['latency_max'])} ms\n"
+        f"{'':10s} {details}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--emails", type=int, default=200, help="emails per burst")
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="seconds per email, slow run"
+    )
+    args = parser.parse_args()
+
+    scenarios = [
+        ("burst", burst, [args.emails]),
+        ("slow", burst, [args.emails, args.latency]),
+        ("retry", retry, [10]),
+        ("give up", give_up, [5]),
+        ("restart", restart, [20]),
+        ("digest", digest, [20]),
+    ]
+
+    failed = False
+    for name, scenario, scenario_args in scenarios:
+        spool_path = tempfile.mkdtemp(prefix="medwatch-spool-")
+        try:
+            stats, details, failures = scenario(spool_path, *scenario_args)
+        finally:
+            shutil.rmtree(spool_path)
+
+        print(report(name, stats, details))
+        for failure in failures:
+            failed = True
+            print(f"  FAIL: {failure}")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+
+"""
+Replays a corpus of recorded press release pages through the monitoring
+pipeline fully offline and reports the time, throughput and peak memory of
+each stage:
+
+    read                 reading the snapshot from disk (stands in for fetching)
+    cache_updated        change detection, run on an unchanged and a changed page
+    get_anchors          anchor extraction of the new and old page
+    get_new_diff         finding anchors that are new
+    relevant_anchors     keyword matching
+    anchors_to_message   composing the email body (links resolved offline)
+
+    python bench_pipeline.py                     # corpus/ from record_corpus.py
+    python bench_pipeline.py --synthetic 200     # generated corpus of 200 sites
+    python bench_pipeline.py --backend bs4       # compare anchor backends
+    python bench_pipeline.py --processes 1 2 4   # parsing throughput of a ParserPool
+
+Consecutive snapshots of the same page are replayed as before/after pairs.
+A synthetic corpus is generated when no recorded corpus is found.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+from collections import defaultdict
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import medwatch as mw
+
+from medwatch.fixture_server import TOPICS, synthetic_page
+
+DIR_CORPUS = os.path.join(HERE, "corpus")
+DIR_KEYWORDS = os.path.join(HERE, "../../datasets/keywords_covid.csv")
+
+STAGES = [
+    "read",
+    "cache_updated",
+    "get_anchors",
+    "get_new_diff",
+    "relevant_anchors",
+    "anchors_to_message",
+]
+
+
+class OfflineAdapter(requests.adapters.BaseAdapter):
+    """
+    Transport adapter that fails every request immediately, so link checks in
+    anchors_to_message() never touch the network during a benchmark
+    """
+
+    def send(self, request, **kwargs):
+        raise requests.ConnectionError(f"Offline benchmark: {request.url}")
+
+    def close(self):
+        pass
+
+
+def offline_session():
+    session = requests.Session()
+    session.mount("https://", OfflineAdapter())
+    session.mount("http://", OfflineAdapter())
+
+    return session
+
+
+def synthetic_corpus(corpus, n_sites=50, n_items=100, n_new=3, seed=0):
+    """
+    Writes a corpus of before/after snapshots of synthetic press release pages
+    in the layout used by record_corpus.py
+
+    Parameters:
+    -------------
+    corpus: str - Directory of the corpus
+    n_sites: int = 50 - Number of pages
+    n_items: int = 100 - Press releases listed on each page
+    n_new: int = 3 - Press releases added between the snapshots
+    seed: int = 0 - Random seed
+
+    Returns:
+    -------------
+    n/a
+    """
+
+    rng = random.Random(seed)
+
+    for site in range(n_sites):
+        company = f"Company{site} Therapeutics"
+        url = f"https://www.company{site}.com/media/press-releases.html"
+        releases = [(ii, rng.choice(TOPICS)) for ii in range(n_items + n_new)]
+
+        before = synthetic_page(company, releases[:n_items][::-1])
+        after = synthetic_page(company, releases[n_new:][::-1])
+
+        page_dir = os.path.join(corpus, mw.url_to_filename(url))
+        os.makedirs(page_dir, exist_ok=True)
+
+        with open(os.path.join(page_dir, "url.txt"), "w") as f:
+            f.write(url)
+        with open(os.path.join(page_dir, "0-before.html"), "w") as f:
+            f.write(before)
+        with open(os.path.join(page_dir, "1-after.html"), "w") as f:
+            f.write(after)
+
+
+def load_pairs(corpus):
+    """
+    Pairs consecutive snapshots of each page in a corpus
+
+    Parameters:
+    -------------
+    corpus: str - Directory of the corpus
+
+    Returns:
+    -------------
+    pairs: list of (str, str, str) - Url, before snapshot and after snapshot files
+    """
+
+    pairs = []
+
+    for name in sorted(os.listdir(corpus)):
+        page_dir = os.path.join(corpus, name)
+        if not os.path.isfile(os.path.join(page_dir, "url.txt")):
+            continue
+
+        with open(os.path.join(page_dir, "url.txt")) as f:
+            url = f.read().strip()
+
+        snapshots = sorted(
+            os.path.join(page_dir, filename)
+            for filename in os.listdir(page_dir)
+            if filename.endswith(".html")
+        )
+        for before, after in zip(snapshots, snapshots[1:]):
+            pairs.append((url, before, after))
+
+    return pairs
+
+
+class StageMeter:
+    """
+    Accumulates time, calls, bytes and (optionally) peak traced memory of
+    each stage of the pipeline
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.nbytes = defaultdict(int)
+        self.peak = defaultdict(int)
+
+    def __call__(self, stage, nbytes, fn, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.seconds[stage] += time.perf_counter() - start
+
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - current
+            self.peak[stage] = max(self.peak[stage], peak)
+
+        self.calls[stage] += 1
+        self.nbytes[stage] += nbytes
+
+        return result
+
+
+def read_page(filename):
+    with open(filename, "r") as f:
+        page = f.read()
+
+    return " ".join(page.split())
+
+
+def replay(pairs, keywords, meter, backend="stream"):
+    """
+    Runs every before/after pair through the pipeline, logging into a
+    temporary directory
+
+    Parameters:
+    -------------
+    pairs: list of (str, str, str) - See load_pairs()
+    keywords: list of str - Keywords that mark an anchor as relevant
+    meter: StageMeter - Records each stage
+    backend: str = 'stream' - Anchor extraction backend, see mw.extract_anchors()
+
+    Returns:
+    -------------
+    n_relevant: int - Total relevant new anchors found
+    """
+
+    path = tempfile.mkdtemp(prefix="medwatch-bench-") + "/"
+    session = offline_session()
+    n_relevant = 0
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for url, before_file, after_file in pairs:
+                before = meter(
+                    "read", os.path.getsize(before_file), read_page, before_file
+                )
+                after = meter(
+                    "read", os.path.getsize(after_file), read_page, after_file
+                )
+
+                # Previous snapshot is the cached page (not timed)
+                mw.store_cache(url, before, path=path)
+
+                meter(
+                    "cache_updated",
+                    len(before),
+                    mw.cache_updated,
+                    url,
+                    before,
+                    path=path,
+                )
+                meter(
+                    "cache_updated", len(after), mw.cache_updated, url, after, path=path
+                )
+
+                anchors = meter(
+                    "get_anchors", len(after), mw.extract_anchors, after, backend
+                )
+                old_anchors = meter(
+                    "get_anchors", len(before), mw.extract_anchors, before, backend
+                )
+
+                diff_anchors = meter(
+                    "get_new_diff", 0, mw.get_new_diff, anchors, old_anchors
+                )
+                rel_anchors, rel_keywords = meter(
+                    "relevant_anchors", 0, mw.relevant_anchors, diff_anchors, keywords
+                )
+                meter(
+                    "anchors_to_message",
+                    0,
+                    mw.anchors_to_message,
+                    rel_anchors,
+                    rel_keywords,
+                    url,
+                    path=path,
+                    session=session,
+                )
+
+                n_relevant += len(rel_anchors)
+    finally:
+        shutil.rmtree(path)
+
+    return n_relevant
+
+
+def parse_pool(pairs, keywords, processes, backend="stream"):
+    """
+    Times a mw.ParserPool analyzing the new page of every pair from raw bytes,
+    as after a sweep(decode=False)
+
+    Parameters:
+    -------------
+    pairs: list of (str, str, str) - See load_pairs()
+    keywords: list of str - Keywords that mark an anchor as relevant
+    processes: int - Worker processes, 0 parses in this process
+    backend: str = 'stream' - Anchor extraction backend, see mw.extract_anchors()
+
+    Returns:
+    -------------
+    pages_per_s: float - Pages analyzed per second
+    """
+
+    results = []
+    for url, _, after_file in pairs:
+        with open(after_file, "rb") as f:
+            content = f.read()
+        results.append(
+            {
+                "url": url,
+                "page": None,
+                "content": content,
+                "encoding": "utf-8",
+                "error": None,
+                "not_modified": False,
+            }
+        )
+
+    path = tempfile.mkdtemp(prefix="medwatch-bench-") + "/"
+    try:
+        with mw.ParserPool(processes=processes, backend=backend) as parser_pool:
+            # Workers are started (and modules imported) before timing
+            parser_pool.analyze(results[:processes], keywords, path=path)
+
+            start = time.perf_counter()
+            parser_pool.analyze(results, keywords, path=path)
+            seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(path)
+
+    return len(results) / seconds
+
+
+def report(meter, memory_meter, n_pairs):
+    """
+    Formats a table of the time, throughput and peak memory of each stage
+
+    Returns:
+    -------------
+    table: str
+    """
+
+    lines = [
+        f"{'stage':<20}{'calls':>7}{'total ms':>11}{'ms/call':>10}"
+        f"{'pairs/s':>10}{'MB/s':>9}{'peak KB':>10}"
+    ]
+
+    total = 0
+    for stage in STAGES:
+        seconds = meter.seconds[stage]
+        calls = meter.calls[stage]
+        total += seconds
+
+        per_call = 1000 * seconds / calls if calls else 0
+        pairs_per_s = n_pairs / seconds if seconds else 0
+        mb_per_s = meter.nbytes[stage] / 1e6 / seconds if seconds else 0
+        mb_per_s = f"{mb_per_s:.1f}" if meter.nbytes[stage] else "-"
+        peak_kb = memory_meter.peak[stage] / 1024
+
+        lines.append(
+            f"{stage:<20}{calls:>7}{1000 * seconds:>11.1f}{per_call:>10.3f}"
+            f"{pairs_per_s:>10.1f}{mb_per_s:>9}{peak_kb:>10.0f}"
+        )
+
+    lines.append(f"{'total':<20}{'':>7}{1000 * total:>11.1f}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--corpus", default=DIR_CORPUS, help="recorded corpus directory"
+    )
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N sites")
+    parser.add_argument("--backend", default="stream", choices=mw.ANCHOR_BACKENDS)
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed replays (best kept)"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        nargs="+",
+        help="time a ParserPool of each size instead (0 parses in-process)",
+    )
+    args = parser.parse_args()
+
+    synthetic_dir = None
+    corpus = args.corpus
+    if args.synthetic or not os.path.isdir(corpus) or not load_pairs(corpus):
+        synthetic_dir = tempfile.mkdtemp(prefix="medwatch-corpus-")
+        synthetic_corpus(synthetic_dir, n_sites=args.synthetic or 50)
+        corpus = synthetic_dir
+
+    try:
+        pairs = load_pairs(corpus)
+        keywords = mw.load_keywords_csv(DIR_KEYWORDS)
+        n_bytes = sum(os.path.getsize(after) for _, _, after in pairs)
+        print(
+            f"Corpus: {corpus} ({len(pairs)} pairs, {n_bytes / 1e6:.1f} MB new pages)"
+        )
+        print(f"Anchor backend: {args.backend}\n")
+
+        if args.processes:
+            print(f"{'processes':<12}{'pages/s':>10}")
+            for processes in args.processes:
+                pages_per_s = parse_pool(pairs, keywords, processes, args.backend)
+                print(f"{processes:<12}{pages_per_s:>10.1f}")
+            sys.exit(0)
+
+        # Best of several timed replays, then one replay tracing memory
+        best = None
+        for _ in range(args.repeat):
+            meter = StageMeter()
+            n_relevant = replay(pairs, keywords, meter, backend=args.backend)
+            if best is None or sum(meter.seconds.values()) < sum(best.seconds.values()):
+                best = meter
+
+        memory_meter = StageMeter(trace_memory=True)
+        tracemalloc.start()
+        replay(pairs, keywords, memory_meter, backend=args.backend)
+        tracemalloc.stop()
+
+        print(report(best, memory_meter, len(pairs)))
+        print(f"\n{n_relevant} relevant new anchors found")
+    finally:
+        if synthetic_dir is not None:
+            shutil.rmtree(synthetic_dir)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+Checks that the anchor backends extract the same anchors as BeautifulSoup
+(the 'bs4' backend, what get_anchors() + parse_anchors() return) on pages
+built around the html corner cases the streaming parser handles itself:
+numeric, hex, out of range and empty character references, entities,
+unclosed tags, script/style text and anchors outside <body>.
+
+    python check_backends.py                      # stream backend
+    python check_backends.py --backends stream lxml
+    python check_backends.py --corpus corpus/     # recorded pages as well
+
+Exits 1 if any backend differs from bs4. The lxml backend repairs broken
+markup its own way and is expected to differ on some cases, see
+medwatch.lxml_anchors().
+"""
+
+import os
+import sys
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import medwatch as mw
+
+REFERENCES = [
+    "&#233;",  # Decimal
+    "&#xE9;",  # Hex
+    "&#Xe9;",
+    "&#0;",  # Null
+    "&#128;",  # C1 control read as windows-1252
+    "&#x81;",  # C1 control not in windows-1252
+    "&#1;",  # C0 control
+    "&#xFDD0;",  # Noncharacter
+    "&#xD800;",  # Surrogate
+    "&#x110000;",  # Out of range
+    "&#99999999999999;",
+    "&#;",  # Empty
+    "&#x;",
+    "&#65abc;",  # Unterminated
+    "&#65 b",
+    "&#x41",
+    "&amp;",  # Entities
+    "&eacute;",
+    "&nosuchentity;",
+    "&amp",
+]
+
+STRUCTURE = [
+    "<p><a href='/open'>never closed",
+    "<a href='/nested'>outer <b>bold <i>italic</a> after</b>",
+    "<a href='/script'>text<script>var x = '<a>';</script> more</a>",
+    "<a href='/style'><style>a {}</style>styled</a>",
+    "<a href='/comment'>before<!-- <a href='/hidden'>x</a> -->after</a>",
+    "<a>no href</a><a href>empty href</a>",
+    "<a href='/void'>line<br>break<img src='x'></a>",
+    "<a href='/cdata'><![CDATA[data]]></a>",
+]
+
+
+def cases():
+    """
+    Pages to compare the backends on
+
+    Returns:
+    -------------
+    pages: list of (name, html) tuples
+    """
+
+    pages = []
+    for reference in REFERENCES:
+        body = f"<a href='/ref?q={reference}'>before {reference} after</a>"
+        pages.append((reference, f"<html><body>{body}</body></html>"))
+
+    for snippet in STRUCTURE:
+        pages.append((snippet, f"<html><body>{snippet}</body></html>"))
+
+    pages.append(
+        (
+            "anchors outside <body>",
+            "<html><head><a href='/head'>head</a></head><body>"
+            "<a href='/body'>body</a></body><a href='/after'>after</a></html>",
+        )
+    )
+    pages.append(("no <body>", "<a href='/a'>a</a><a href='/b'>b &#8211; c</a>"))
+
+    return pages
+
+
+def corpus_pages(corpus):
+    """
+    Recorded pages of a corpus directory, see record_corpus.py
+
+    Returns:
+    -------------
+    pages: list of (name, html) tuples
+    """
+
+    pages = []
+    for root, _, filenames in os.walk(corpus):
+        for filename in sorted(filenames):
+            if filename.endswith(".html"):
+                with open(os.path.join(root, filename), "r") as f:
+                    pages.append((filename, f.read()))
+
+    return pages
+
+
+def compare(pages, backend):
+    """
+    Anchors of each page from backend and from bs4, where they differ
+
+    Returns:
+    -------------
+    mismatches: list of (name, backend anchors, bs4 anchors) tuples
+    """
+
+    mismatches = []
+    for name, page in pages:
+        expected = mw.extract_anchors(page, backend="bs4")
+        anchors = mw.extract_anchors(page, backend=backend)
+        if anchors != expected:
+            mismatches.append((name, anchors, expected))
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["stream"],
+        choices=[backend for backend in mw.ANCHOR_BACKENDS if backend != "bs4"],
+    )
+    parser.add_argument("--corpus", help="directory of recorded pages to compare too")
+    args = parser.parse_args()
+
+    pages = cases()
+    if args.corpus is not None:
+        pages += corpus_pages(args.corpus)
+
+    failed = False
+    for backend in args.backends:
+        mismatches = compare(pages, backend)
+        print(f"{backend}: {len(pages) - len(mismatches)}/{len(pages)} pages match bs4")
+        for name, anchors, expected in mismatches:
+            failed = True
+            print(f"  FAIL {name!r}\n    {backend}: {anchors}\n    bs4: {expected}")
+
+    sys.exit(1 if failed else 0)
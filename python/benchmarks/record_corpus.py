@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Records snapshots of the monitored press release pages into a corpus that
+bench_pipeline.py replays offline. Run it more than once (or with --rounds)
+so each page has before/after snapshots to diff.
+
+    python record_corpus.py                      # one snapshot of every page
+    python record_corpus.py --rounds 2 --wait 3600
+
+Snapshots are saved as corpus/<url filename>/<timestamp>.html with the page's
+url in corpus/<url filename>/url.txt
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import medwatch as mw
+
+LIST_COMPANIES = os.path.join(HERE, "../../datasets/updated_company_list.csv")
+DIR_CORPUS = os.path.join(HERE, "corpus")
+
+GOV_URLS = [
+    "https://www.fda.gov/news-events/fda-newsroom/press-announcements",
+    "https://www.who.int/news-room/releases",
+    "https://www.hhs.gov/coronavirus/news/index.html",
+]
+
+
+def monitored_urls(filename=LIST_COMPANIES):
+    """
+    Press release pages in the company list plus the government pages
+
+    Parameters:
+    -------------
+    filename: str - [path and] filename of the company list csv
+
+    Returns:
+    -------------
+    urls: list of str - Urls to record
+    """
+
+    urls = list(GOV_URLS)
+
+    with open(filename) as csvfile:
+        reader = csv.reader(csvfile, delimiter=",")
+        next(reader)
+
+        for row in reader:
+            url_pr = row[8].strip()
+            if not mw.is_na(url_pr):
+                urls.append(url_pr)
+
+    return urls
+
+
+def record(urls, corpus=DIR_CORPUS, concurrency=20):
+    """
+    Fetches every url once and saves the pages that came back 200
+
+    Parameters:
+    -------------
+    urls: list of str - Urls to record
+    corpus: str - Directory of the corpus
+    concurrency: int = 20 - Maximum number of requests in flight
+
+    Returns:
+    -------------
+    n_saved: int - Number of snapshots saved
+    """
+
+    results, wall_time = mw.sweep(urls, concurrency=concurrency)
+    print(mw.sweep_report(results, wall_time))
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    n_saved = 0
+
+    for result in results:
+        if result["error"] is not None or result["status"] != 200:
+            continue
+
+        page_dir = os.path.join(corpus, mw.url_to_filename(result["url"]))
+        os.makedirs(page_dir, exist_ok=True)
+
+        with open(os.path.join(page_dir, "url.txt"), "w") as f:
+            f.write(result["url"])
+
+        with open(os.path.join(page_dir, f"{timestamp}.html"), "w") as f:
+            f.write(result["page"])
+
+        n_saved += 1
+
+    return n_saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=1, help="snapshots per page")
+    parser.add_argument(
+        "--wait", type=float, default=3600, help="seconds between rounds"
+    )
+    parser.add_argument("--corpus", default=DIR_CORPUS, help="corpus directory")
+    args = parser.parse_args()
+
+    urls = monitored_urls()
+
+    for ii in range(args.rounds):
+        if ii > 0:
+            time.sleep(args.wait)
+
+        n_saved = record(urls, corpus=args.corpus)
+        print(f"Round {ii + 1}: saved {n_saved} of {len(urls)} pages to {args.corpus}")
@@ -15,11 +15,10 @@ import pickle
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
-import pandas as pd
 from bs4 import BeautifulSoup
-from pandas_datareader import data as pd_data
-from yahooquery import Ticker
-from googlesearch import search
+
+# pandas, pandas_datareader, yahooquery and googlesearch are only imported by
+# the functions using them, so the monitor (which never does) starts without them
 
 
 # COLLECTING AND PREPPING DATA ON COMPANY INFO
@@ -48,6 +47,8 @@ def create_company_df(companies):
     df: pandas.DataFrame - Summary of company info as described above
     """
 
+    import pandas as pd
+
     companies = list(set(companies))  # removes duplicates
 
     symbols = []
@@ -121,6 +122,8 @@ def add_companies_to_csv(companies, filename):
     n/a
     """
 
+    import pandas as pd
+
     df_add = create_company_df(companies)
     df_old = pd.read_csv(filename)
     frames = [df_old, df_add]
@@ -144,6 +147,8 @@ def parse_who_companies(filename):
     companies: list of str - Non-academia organizations found in csv
     """
 
+    import pandas as pd
+
     df = pd.read_csv(filename)
     developers = df["Developer"].tolist()
     companies = []
@@ -267,6 +272,8 @@ def check_usa_mkts(yahoo_json):
         "PHLX",
     ]
 
+    import pandas as pd
+
     # Load JSON into dataframe (**may operated directly as JSON)
     # and see if any of the exchanges listed in the query result match
     # the list of usa_mkts
@@ -307,6 +314,8 @@ def get_company_url(ticker_symbol: str):
     url: str - String of company's homepage url
     """
 
+    from yahooquery import Ticker
+
     response = Ticker(ticker_symbol, asynchronous=True)
     data = response.asset_profile
     url = data[ticker_symbol]["website"]
@@ -366,6 +375,9 @@ def get_market_cap(symbol):
     -------------
     cap: int - Market cap of company in currency of country company is located in
     """
+
+    from pandas_datareader import data as pd_data
+
     try:
         cap = pd_data.get_quote_yahoo(symbol)["marketCap"]
         cap = cap[symbol]
@@ -429,6 +441,8 @@ def search_google(query, num_results=1):
     results: list - List of strings with domains of search results
     """
 
+    from googlesearch import search
+
     results = []
     num_ppg = min([num_results, 10])
     for i in search(
@@ -1,3 +1,9 @@
 from .dataprep import *
 from .sysfns import *
-from .webfns import *
\ No newline at end of file
+from .webfns import *
+from .keywords import *
+from .notify import *
+from .snapshots import *
+from .state import *
+from .limiter import *
+from .sweep import *
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
 import os
-import requests
+import json
 import csv
 
-import pandas as pd
-from pandas_datareader import data as pd_data
-from yahooquery import Ticker
-from googlesearch import search
+from .sysfns import is_na
+from .webfns import TIMEOUT, get_session, prune_url
+
+# pandas, pandas_datareader, yahooquery and googlesearch are only imported by
+# the functions using them, so the monitor (which never does) starts without them
 
 
 # COLLECTING AND PREPPING DATA ON COMPANY INFO
@@ -35,6 +36,8 @@ def create_company_df(companies):
     df: pandas.DataFrame - Summary of company info as described above
     """
 
+    import pandas as pd
+
     companies = list(set(companies))  # removes duplicates
 
     symbols = []
@@ -107,6 +110,8 @@ def add_companies_to_csv(companies, filename):
     n/a
     """
 
+    import pandas as pd
+
     df_add = create_company_df(companies)
     df_old = pd.read_csv(filename)
     frames = [df_old, df_add]
@@ -128,6 +133,8 @@ def parse_who_companies(filename):
     companies: list of str - Non-academia organizations found in csv
     """
 
+    import pandas as pd
+
     df = pd.read_csv(filename)
     developers = df["Developer"].tolist()
     companies = []
@@ -191,7 +198,7 @@ def get_company_info(company_name):
     query = f"http://d.yimg.com/autoc.finance.yahoo.com/autoc?query={co}\
     &region=1&lang=en&callback=YAHOO.Finance.SymbolSuggest.ssCallback"
 
-    response = requests.get(query)
+    response = get_session().get(query, timeout=TIMEOUT)
 
     fdata = response.text.split("(", 1)[1]
     fdata = fdata.rsplit(")", 1)[0]
@@ -243,6 +250,8 @@ def check_usa_mkts(yahoo_json):
         "PHLX",
     ]
 
+    import pandas as pd
+
     # Load JSON into dataframe (**may operated directly as JSON)
     # and see if any of the exchanges listed in the query result match
     # the list of usa_mkts
@@ -280,6 +289,8 @@ def get_company_url(ticker_symbol: str):
     url: str - String of company's homepage url
     """
 
+    from yahooquery import Ticker
+
     response = Ticker(ticker_symbol, asynchronous=True)
     data = response.asset_profile
     url = data[ticker_symbol]["website"]
@@ -331,6 +342,9 @@ def get_market_cap(symbol):
     -------------
     cap: int - Market cap of company in currency of country company is located in
     """
+
+    from pandas_datareader import data as pd_data
+
     try:
         cap = pd_data.get_quote_yahoo(symbol)["marketCap"]
         cap = cap[symbol]
@@ -390,6 +404,8 @@ def search_google(query, num_results=1):
     results: list - List of strings with domains of search results
     """
 
+    from googlesearch import search
+
     results = []
     num_ppg = min([num_results, 10])
     for i in search(
@@ -410,33 +426,6 @@ def search_google(query, num_results=1):
     return results
 
 
-def prune_url(full_url: str, cut_chars=[]):
-    """
-    Method to clean up domain (e.g. removes www. or http://)
-    Found having full URL can yield odd Google searches
-    e.g. prune_url('https://www.google.com/', cut_chars=['https://', 'www.'])
-         returns 'google.com'
-    Parameters:
-    -------------
-    full_url: str - String of URL to be pruned
-    Returns:
-    -------------
-    pruned_url: str - String of pruned URL
-    """
-
-    # cut_chars = ["https://", "http://", "www."]
-
-    for cut in cut_chars:
-        full_url = full_url.replace(cut, "")
-
-    if full_url[-1] == "/":
-        pruned_url = full_url[0:-1]
-    else:
-        pruned_url = full_url
-
-    return pruned_url
-
-
 def get_press_release_page(company_url: str):
     """
     Finds 'press releases' landing page based off company's official website 
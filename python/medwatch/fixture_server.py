@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the monitored sites, for load testing sweeps without
+touching the real sites. Serves synthetic press release pages whose links
+churn over time, with configurable page size, latency, ETag/Last-Modified
+support and error rates.
+
+    python -m medwatch.fixture_server --sites 2000 --churn 0.5 --write-targets targets.csv
+    python -m medwatch.runner fixture.yaml    # a group with companies: targets.csv
+
+Routes:
+    /site/<n>/press-releases.html   press release page of site n
+    /site/<n>/news/<id>.html        a press release (what the page links to)
+    /targets.csv                    company list pointing at this server
+    /stats                          counts of responses served (JSON)
+"""
+
+import sys
+import json
+import math
+import random
+import argparse
+import threading
+import time
+
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = [
+    "Announces Positive Phase 3 Results for COVID-19 Vaccine Candidate",
+    "Enters Manufacturing Partnership to Supply Vaccine Doses",
+    "Receives Government Funding Under Operation Warp Speed",
+    "Reports Second Quarter Financial Results",
+    "to Present at Upcoming Healthcare Conference",
+    "Appoints New Chief Financial Officer",
+    "Begins Phase 1/2 Clinical Trial of Antibody Treatment",
+    "Publishes Safety Data Showing No Serious Adverse Reactions",
+    "Announces Annual General Meeting Results",
+    "Expands Research Facility",
+]
+
+COMPANY_LIST_HEADER = [
+    "Company",
+    "Yahoo Listed Co.",
+    "Symbol",
+    "Exchange",
+    "Market Cap",
+    "Company Size",
+    "Is American",
+    "Home URL",
+    "Press Release URL",
+]
+
+
+# SYNTHETIC PAGES
+
+
+def synthetic_page(company, items, n_nav=60, filler=8, link_prefix="/media"):
+    """
+    Generates a press release page listing items, padded with navigation
+    links, scripts and boilerplate like a real investor relations page
+
+    Parameters:
+    -------------
+    company: str - Name of the company
+    items: list of (int, str) - Id and title of each press release
+    n_nav: int = 60 - Number of navigation links
+    filler: int = 8 - Sentences of summary under each press release
+    link_prefix: str = '/media' - Path press release links start with
+
+    Returns:
+    -------------
+    page: str - Html content of the page
+    """
+
+    page = [
+        "<!DOCTYPE html><html><head>",
+        f"<title>{company} - Press Releases</title>",
+        "<script>window.dataLayer = window.dataLayer || [];</script>",
+        "<style>.release { margin: 0 } .nav a { color: #333 }</style>",
+        "</head><body><nav class='nav'><ul>",
+    ]
+    for ii in range(n_nav):
+        page.append(f"<li><a href='/section/{ii}/'>Section {ii}</a></li>")
+    page.append("</ul></nav><main><h1>Press Releases</h1>")
+
+    for item_id, title in items:
+        page.append(
+            f"<div class='release'><span class='date'>{item_id % 28 + 1} Jul 2020"
+            f"</span><h3><a href='{link_prefix}/news/{item_id}.html' "
+            f"class='title'>{company} {title}</a></h3><p>{'Lorem ipsum dolor. ' * filler}"
+            f"</p><a href='{link_prefix}/news/{item_id}.pdf'>PDF</a></div>"
+        )
+
+    page.append("</main><footer>&copy; 2020 " + company + "</footer></body></html>")
+
+    return "\n".join(page)
+
+
+def release_title(site, item_id):
+    """Title of a press release, the same every time it is asked for"""
+
+    return random.Random(site * 1000003 + item_id).choice(TOPICS)
+
+
+# SERVER
+
+
+class FixtureConfig:
+    """
+    Behaviour of the simulated sites
+
+    Parameters:
+    -------------
+    sites: int = 100 - Number of sites served
+    links: int = 100 - Press releases listed on each page (page size)
+    filler: int = 8 - Sentences of summary under each press release (page size)
+    churn: float = 0.1 - New press releases per site per minute
+    latency: float = 0.1 - Median seconds before responding
+    latency_sigma: float = 0.5 - Spread of the lognormal latency (0 is fixed)
+    validators: str = 'both' - 'etag', 'last-modified', 'both' or 'none'
+    error_rate: float = 0 - Fraction of requests answered with 503
+    throttle_rate: float = 0 - Fraction of requests answered with 429 + Retry-After
+    seed: int = 0 - Random seed of the site phases
+    """
+
+    def __init__(
+        self,
+        sites=100,
+        links=100,
+        filler=8,
+        churn=0.1,
+        latency=0.1,
+        latency_sigma=0.5,
+        validators="both",
+        error_rate=0,
+        throttle_rate=0,
+        seed=0,
+    ):
+        self.sites = sites
+        self.links = links
+        self.filler = filler
+        self.churn = churn
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.validators = validators
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+        # Sites do not all change at the same moment
+        rng = random.Random(seed)
+        self.phases = [rng.random() for _ in range(sites)]
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server of the simulated sites, see FixtureConfig
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, config):
+        super().__init__(address, FixtureHandler)
+        self.config = config
+        self.start_time = time.time()
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, status):
+        with self.stats_lock:
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def version(self, site):
+        """
+        Number of press releases site has published since the server started.
+        The newest config.links of them are listed on its page.
+        """
+
+        minutes = (time.time() - self.start_time) / 60
+        return int(minutes * self.config.churn + self.config.phases[site])
+
+    def last_modified(self, site, version):
+        """Unix time the page of site last changed"""
+
+        if self.config.churn <= 0:
+            return self.start_time
+
+        minutes = (version - self.config.phases[site]) / self.config.churn
+        return max(self.start_time, self.start_time + 60 * minutes)
+
+    def press_page(self, site, version):
+        items = [
+            (item_id, release_title(site, item_id))
+            for item_id in range(version + self.config.links - 1, version - 1, -1)
+        ]
+        return synthetic_page(
+            f"Company{site} Therapeutics",
+            items,
+            filler=self.config.filler,
+            link_prefix=f"/site/{site}",
+        )
+
+    def targets_csv(self):
+        rows = [",".join(COMPANY_LIST_HEADER)]
+        for site in range(self.config.sites):
+            company = f"Company{site} Therapeutics"
+            home = f"{self.base_url}/site/{site}/"
+            press = f"{self.base_url}/site/{site}/press-releases.html"
+            rows.append(
+                f"{company},{company},FX{site},NASDAQ,n/a,small,Y,{home},{press}"
+            )
+
+        return "\n".join(rows) + "\n"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def send(self, status, body=b"", headers={}, send_body=True):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if send_body and body:
+            self.wfile.write(body)
+
+        self.server.count(status)
+
+    def respond(self, send_body=True):
+        server = self.server
+        config = server.config
+        parts = self.path.split("?")[0].strip("/").split("/")
+
+        if parts == ["stats"]:
+            with server.stats_lock:
+                body = json.dumps(server.stats).encode()
+            return self.send(200, body, {"Content-Type": "application/json"}, send_body)
+
+        if parts == ["targets.csv"]:
+            body = server.targets_csv().encode()
+            return self.send(200, body, {"Content-Type": "text/csv"}, send_body)
+
+        site = None
+        if len(parts) >= 3 and parts[0] == "site" and parts[1].isdigit():
+            site = int(parts[1])
+        if site is None or site >= config.sites:
+            return self.send(404, send_body=send_body)
+
+        # Simulated network and server time
+        if config.latency > 0:
+            if config.latency_sigma > 0:
+                delay = random.lognormvariate(
+                    math.log(config.latency), config.latency_sigma
+                )
+            else:
+                delay = config.latency
+            time.sleep(delay)
+
+        roll = random.random()
+        if roll < config.throttle_rate:
+            return self.send(429, headers={"Retry-After": "1"}, send_body=send_body)
+        if roll < config.throttle_rate + config.error_rate:
+            return self.send(503, send_body=send_body)
+
+        if parts[2:] == ["press-releases.html"]:
+            return self.press_release_page(site, send_body)
+
+        if len(parts) == 4 and parts[2] == "news":
+            item_id = parts[3].split(".")[0]
+            if item_id.isdigit() and int(item_id) < server.version(site) + config.links:
+                title = release_title(site, int(item_id))
+                body = f"<html><body><h1>{title}</h1></body></html>".encode()
+                return self.send(200, body, {"Content-Type": "text/html"}, send_body)
+
+        return self.send(404, send_body=send_body)
+
+    def press_release_page(self, site, send_body):
+        server = self.server
+        config = server.config
+
+        version = server.version(site)
+        last_modified = server.last_modified(site, version)
+        etag = f'"{site}-{version}"'
+
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if config.validators in ("both", "etag"):
+            headers["ETag"] = etag
+        if config.validators in ("both", "last-modified"):
+            headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+        # Conditional GET
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        not_modified = False
+        if if_none_match is not None and "ETag" in headers:
+            not_modified = if_none_match == etag
+        elif if_modified_since is not None and "Last-Modified" in headers:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+                not_modified = int(last_modified) <= since
+            except (TypeError, ValueError):
+                pass
+
+        if not_modified:
+            return self.send(304, headers=headers, send_body=send_body)
+
+        body = server.press_page(site, version).encode("utf-8")
+        return self.send(200, body, headers, send_body)
+
+
+def start_fixture_server(config=None, host="127.0.0.1", port=0):
+    """
+    Starts a fixture server in a background thread
+
+    e.g. server = start_fixture_server(FixtureConfig(sites=10, latency=0))
+         url = f'{server.base_url}/site/0/press-releases.html'
+         server.shutdown()
+
+    Parameters:
+    -------------
+    config: FixtureConfig = None - Behaviour of the sites (defaults if None)
+    host: str = '127.0.0.1' - Address to listen on
+    port: int = 0 - Port to listen on (0 picks a free port)
+
+    Returns:
+    -------------
+    server: FixtureServer - Running server, stop with server.shutdown()
+    """
+
+    if config is None:
+        config = FixtureConfig()
+
+    server = FixtureServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--links", type=int, default=100, help="releases per page")
+    parser.add_argument("--filler", type=int, default=8, help="sentences per release")
+    parser.add_argument("--churn", type=float, default=0.1, help="new links/site/min")
+    parser.add_argument("--latency", type=float, default=0.1, help="median seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument(
+        "--validators",
+        default="both",
+        choices=["both", "etag", "last-modified", "none"],
+    )
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--write-targets", help="write a company list csv to this file")
+    args = parser.parse_args()
+
+    config = FixtureConfig(
+        sites=args.sites,
+        links=args.links,
+        filler=args.filler,
+        churn=args.churn,
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        validators=args.validators,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    server = FixtureServer((args.host, args.port), config)
+
+    if args.write_targets:
+        with open(args.write_targets, "w") as f:
+            f.write(server.targets_csv())
+        print(f"Wrote company list of {args.sites} sites to {args.write_targets}")
+
+    print(f"Serving {args.sites} sites on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats))
+        sys.exit(0)
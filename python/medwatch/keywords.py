@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+from collections import deque
+from functools import lru_cache
+
+
+# MATCHING KEYWORDS
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton compiled once from a list of keywords and a list of
+    ignorewords. Every keyword and ignoreword found in a piece of text is
+    reported from a single case-insensitive pass over the text, so the cost of
+    checking an anchor does not grow with the number of keywords.
+
+    e.g. matcher = KeywordMatcher(['vaccine', 'phase 3'], ['Daily Roundup'])
+         matcher.match('/news/phase-3', 'Phase 3 vaccine trial')
+         returns (['vaccine', 'phase 3'], [])
+
+    Parameters:
+    -------------
+    keywords: list of str - Keywords that mark text as relevant
+    ignorewords: list of str - Keywords that mark text as not relevant
+    """
+
+    def __init__(self, keywords=[], ignorewords=[]):
+        self.keywords = list(keywords)
+        self.ignorewords = list(ignorewords)
+
+        # Pattern ids are positions in keywords followed by ignorewords
+        patterns = [pattern.lower() for pattern in self.keywords + self.ignorewords]
+        self.n_keywords = len(self.keywords)
+
+        # Empty patterns are found in any text
+        self.always = {ii for ii, pattern in enumerate(patterns) if pattern == ""}
+
+        # Trie of all patterns
+        goto = [{}]
+        outputs = [set()]
+        for ii, pattern in enumerate(patterns):
+            if pattern == "":
+                continue
+
+            state = 0
+            for char in pattern:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state].add(ii)
+
+        # Failure links (breadth first), merged into full transition tables so
+        # scanning is one dict lookup per character
+        fail = [0] * len(goto)
+        transitions = [dict(edges) for edges in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, fail_char_state in transitions[fail[state]].items():
+                if char not in transitions[state]:
+                    transitions[state][char] = fail_char_state
+
+            for char, next_state in goto[state].items():
+                if state != 0:
+                    fail[next_state] = transitions[fail[state]].get(char, 0)
+                outputs[next_state] |= outputs[fail[next_state]]
+                queue.append(next_state)
+
+        self.transitions = transitions
+        self.outputs = [frozenset(output) for output in outputs]
+
+    def scan(self, text):
+        """
+        Finds the ids of all patterns in text (case insensitive)
+
+        Parameters:
+        -------------
+        text: str - Text to search
+
+        Returns:
+        -------------
+        found: set of int - Ids of the patterns found, see __init__()
+        """
+
+        found = set(self.always)
+        transitions = self.transitions
+        outputs = self.outputs
+
+        state = 0
+        for char in text.lower():
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+
+        return found
+
+    def match(self, href, content):
+        """
+        Finds the keywords and ignorewords in an anchor's href or content
+
+        Parameters:
+        -------------
+        href: str - href of the anchor
+        content: str - Content/title of the anchor
+
+        Returns:
+        -------------
+        rel_keywords: list of str - Keywords found (in the order given)
+        ignore_keywords: list of str - Ignorewords found (in the order given)
+        """
+
+        # The separator keeps patterns from matching across href and content
+        found = self.scan(f"{href}\x00{content}")
+
+        rel_keywords = [kw for ii, kw in enumerate(self.keywords) if ii in found]
+        ignore_keywords = [
+            kw
+            for ii, kw in enumerate(self.ignorewords)
+            if ii + self.n_keywords in found
+        ]
+
+        return rel_keywords, ignore_keywords
+
+
+@lru_cache(maxsize=32)
+def _compile_keywords(keywords, ignorewords):
+    return KeywordMatcher(keywords, ignorewords)
+
+
+def compile_keywords(keywords=[], ignorewords=[]):
+    """
+    Returns a KeywordMatcher for the given keywords and ignorewords. Matchers
+    are cached so the same lists are only compiled once.
+
+    Parameters:
+    -------------
+    keywords: list of str - Keywords that mark text as relevant
+    ignorewords: list of str - Keywords that mark text as not relevant
+
+    Returns:
+    -------------
+    matcher: KeywordMatcher
+    """
+
+    return _compile_keywords(tuple(keywords), tuple(ignorewords))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+import time
+import socket
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+THROTTLE_STATUSES = (429, 503)  # Responses that ask us to slow down
+
+
+# PER-HOST RATE LIMITING
+
+
+def retry_after_seconds(value):
+    """
+    Seconds to wait given by a Retry-After header (delay-seconds or HTTP-date),
+    None if the value cannot be parsed
+
+    Parameters:
+    -------------
+    value: str - Value of the Retry-After header
+
+    Returns:
+    -------------
+    seconds: float or None
+    """
+
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """
+    Keeps requests to each host polite: a token bucket limits how often a host
+    is requested (rate per second, with bursts of up to burst requests), at
+    most max_concurrent requests to a host are in flight at a time, and a host
+    that answers 429/503 is left alone for its Retry-After (or cooldown)
+    seconds. Requests that cannot go out within max_wait seconds are deferred.
+
+    Hosts can share a limit: groups maps a domain (and its subdomains) to a
+    group name, e.g. the hosts of one investor relations platform, and with
+    by_ip hosts resolving to the same address share one. Addresses are looked
+    up by resolve() before a sweep (sweep() does), never while a request waits.
+
+    The session should leave 429/503 responses to the limiter instead of
+    retrying them, see webfns.create_session(retry_throttled=False).
+
+    e.g. configure_session(retry_throttled=False)
+         limiter = HostLimiter(rate=0.5, groups={'fda.gov': 'fda'})
+         results, wall_time = sweep(urls, limiter=limiter)
+         print(limiter.report())
+
+    Parameters:
+    -------------
+    rate: float = 1 - Requests per second per host once the burst is used up
+    burst: int = 3 - Requests a host can be sent back to back
+    max_concurrent: int = 2 - Requests in flight per host
+    max_wait: float = 10 - Seconds a request waits for its host before it is deferred
+    cooldown: float = 30 - Seconds a throttling host is left alone without a Retry-After
+    max_retry_after: float = 600 - Longest Retry-After honoured
+    groups: dict = None - Domain -> group name for hosts sharing a limit
+    by_ip: bool = False - Hosts resolving to the same address share a limit
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        burst=3,
+        max_concurrent=2,
+        max_wait=10,
+        cooldown=30,
+        max_retry_after=600,
+        groups=None,
+        by_ip=False,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.cooldown = cooldown
+        self.max_retry_after = max_retry_after
+        self.groups = groups or {}
+        self.by_ip = by_ip
+
+        self.hosts = {}
+        self.addresses = {}
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+
+    def key(self, url):
+        """
+        Name of the limit a url falls under: its group, address or host
+        """
+
+        host = (urlsplit(url).hostname or "").lower()
+
+        parts = host.split(".")
+        for i in range(len(parts)):
+            group = self.groups.get(".".join(parts[i:]))
+            if group is not None:
+                return group
+
+        # Hosts not resolved yet have a limit of their own, see resolve()
+        if self.by_ip:
+            return self.addresses.get(host, host)
+
+        return host
+
+    def resolve(self, urls):
+        """
+        Looks up the addresses of the hosts of urls not looked up yet (with
+        by_ip), all at once and without holding the lock, so that key() never
+        waits on DNS. Call before requesting urls, not while requests are in
+        flight, since the limit of a newly resolved host changes
+
+        Parameters:
+        -------------
+        urls: list of str - Urls about to be requested
+        """
+
+        if not self.by_ip:
+            return
+
+        hosts = {(urlsplit(url).hostname or "").lower() for url in urls}
+        hosts = [host for host in hosts if host and host not in self.addresses]
+        if not hosts:
+            return
+
+        def lookup(host):
+            try:
+                return socket.gethostbyname(host)
+            except OSError:
+                return host
+
+        with ThreadPoolExecutor(max_workers=min(len(hosts), 20)) as executor:
+            addresses = dict(zip(hosts, executor.map(lookup, hosts)))
+
+        with self.lock:
+            self.addresses.update(addresses)
+
+    def _host(self, key):
+        if key not in self.hosts:
+            self.hosts[key] = {
+                "tokens": float(self.burst),
+                "refilled": time.monotonic(),
+                "active": 0,
+                "blocked_until": 0.0,
+                "requests": 0,
+                "delayed": 0,
+                "deferred": 0,
+                "throttled": 0,
+                "wait_time": 0.0,
+            }
+
+        return self.hosts[key]
+
+    def _delay(self, host, now):
+        # Seconds until host admits a request, 0 if it does now
+        elapsed = now - host["refilled"]
+        host["tokens"] = min(self.burst, host["tokens"] + elapsed * self.rate)
+        host["refilled"] = now
+
+        if host["blocked_until"] > now:
+            return host["blocked_until"] - now
+        if host["active"] >= self.max_concurrent:
+            return 1 / self.rate if self.rate > 0 else self.max_wait
+        if host["tokens"] < 1:
+            return (1 - host["tokens"]) / self.rate
+
+        return 0.0
+
+    def delay(self, url):
+        """
+        Seconds until the host of url would admit a request, without taking a slot
+        (0 if it would now). Waits on concurrency are estimates, see acquire()
+        """
+
+        with self.lock:
+            return self._delay(self._host(self.key(url)), time.monotonic())
+
+    def acquire(self, url, max_wait=None):
+        """
+        Waits until a request to url may go out and takes a slot for it.
+        Every successful acquire() must be followed by release()
+
+        Parameters:
+        -------------
+        url: str - Url about to be requested
+        max_wait: float = None - Seconds to wait, defaults to self.max_wait
+
+        Returns:
+        -------------
+        acquired: bool - False if the request was deferred
+        """
+
+        if max_wait is None:
+            max_wait = self.max_wait
+
+        key = self.key(url)
+        start = time.monotonic()
+        deadline = start + max_wait
+
+        with self.lock:
+            host = self._host(key)
+            while True:
+                now = time.monotonic()
+                delay = self._delay(host, now)
+                if delay <= 0:
+                    break
+                if now + delay > deadline and host["blocked_until"] > deadline:
+                    host["deferred"] += 1
+                    return False
+                if now >= deadline:
+                    host["deferred"] += 1
+                    return False
+                self.released.wait(min(delay, deadline - now))
+
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                host["delayed"] += 1
+                host["wait_time"] += waited
+
+            host["tokens"] -= 1
+            host["active"] += 1
+            host["requests"] += 1
+
+        return True
+
+    def release(self, url, response=None):
+        """
+        Frees the slot taken by acquire() and backs off the host if the
+        response (or a retry made on the way to it) was throttled
+
+        Parameters:
+        -------------
+        url: str - Url that was requested
+        response: requests.Response = None - Response received, None on errors
+        """
+
+        n_throttled = 0
+        retry_after = None
+        if response is not None:
+            retries = getattr(response.raw, "retries", None)
+            history = getattr(retries, "history", None) or ()
+            n_throttled = sum(1 for r in history if r.status in THROTTLE_STATUSES)
+
+            if response.status_code in THROTTLE_STATUSES:
+                n_throttled += 1
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+
+        with self.lock:
+            host = self._host(self.key(url))
+            host["active"] -= 1
+
+            # Only a final throttled response keeps the host blocked, retries
+            # that went through already waited out their Retry-After
+            if n_throttled:
+                host["throttled"] += n_throttled
+            if response is not None and response.status_code in THROTTLE_STATUSES:
+                if retry_after is None:
+                    retry_after = self.cooldown
+                retry_after = min(retry_after, self.max_retry_after)
+                host["blocked_until"] = max(
+                    host["blocked_until"], time.monotonic() + retry_after
+                )
+
+            self.released.notify_all()
+
+    def stats(self):
+        """
+        Counters of the limiter, in total and per host (or group)
+
+        Returns:
+        -------------
+        stats: dict - Keys 'requests' (sent), 'delayed' (waited for their host),
+            'deferred' (gave up waiting), 'throttled' (429/503 received),
+            'wait_time' (seconds waited) and 'hosts' (same counters per host)
+        """
+
+        counters = ("requests", "delayed", "deferred", "throttled", "wait_time")
+        with self.lock:
+            hosts = {
+                key: {counter: host[counter] for counter in counters}
+                for key, host in self.hosts.items()
+            }
+
+        stats = {
+            counter: sum(host[counter] for host in hosts.values())
+            for counter in counters
+        }
+        stats["hosts"] = hosts
+
+        return stats
+
+    def report(self, top=5):
+        """
+        Summary of the limiter counters, with the most throttled/deferred hosts
+
+        Parameters:
+        -------------
+        top: int = 5 - Number of hosts listed
+
+        Returns:
+        -------------
+        report: str
+        """
+
+        stats = self.stats()
+        report = [
+            f"Host limits: {stats['requests']} requests, {stats['delayed']} delayed "
+            f"({stats['wait_time']:.1f}s waited), {stats['deferred']} deferred, "
+            f"{stats['throttled']} throttled"
+        ]
+
+        hosts = sorted(
+            stats["hosts"].items(),
+            key=lambda item: (-item[1]["throttled"], -item[1]["deferred"]),
+        )
+        for key, host in hosts[:top]:
+            if host["throttled"] or host["deferred"]:
+                report.append(
+                    f"{host['throttled']:6d} throttled {host['deferred']:6d} deferred  {key}"
+                )
+
+        return "\n".join(report)
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+
+import os
+import ssl
+import json
+import time
+import queue
+import smtplib
+import threading
+
+from collections import deque
+from datetime import datetime
+
+# SENDING NOTIFICATIONS
+
+
+def split_subject(message):
+    """
+    Splits an email made by compose_email() into its subject and body
+
+    Parameters:
+    -------------
+    message: str or bytes - Email starting with a 'Subject: ...' line (optional)
+
+    Returns:
+    -------------
+    subject: str - Subject of the email ('' if it has none)
+    body: str - Rest of the email
+    """
+
+    if isinstance(message, bytes):
+        message = message.decode("utf-8")
+
+    if not message.startswith("Subject:"):
+        return "", message
+
+    subject, _, body = message.partition("\n")
+
+    return subject[len("Subject:") :].strip(), body.lstrip("\n")
+
+
+def group_digests(pending):
+    """
+    Combines the emails held for each recipient into one digest. Recipients
+    holding the same emails share one digest, and a single held email is
+    sent as it is.
+
+    Parameters:
+    -------------
+    pending: dict - Recipient -> list of emails (str or bytes) held for them
+
+    Returns:
+    -------------
+    digests: list of (bytes or str, list of str) - Each digest and its recipients
+    """
+
+    groups = {}
+    for receive_address, messages in pending.items():
+        groups.setdefault(tuple(messages), []).append(receive_address)
+
+    digests = []
+    for messages, receive_addresses in groups.items():
+        if len(messages) == 1:
+            digests.append((messages[0], receive_addresses))
+            continue
+
+        time_sent = datetime.now().strftime("%a, %d %b %Y %H:%M:%S")
+        digest = [f"Subject: Medwatch digest: {len(messages)} updates [{time_sent}]\n"]
+        for message in messages:
+            subject, body = split_subject(message)
+            digest.append(f"==== {subject} ====\n{body}")
+
+        digests.append(("\n\n".join(digest).encode("utf-8"), receive_addresses))
+
+    return digests
+
+
+class EmailDispatcher:
+    """
+    Sends notification emails over one SMTP connection that is logged into
+    once and kept open until close(), instead of connecting for every email.
+    Each email is sent once to all of its recipients. In digest mode emails
+    are held until flush() (or the end of a with block) and every recipient
+    gets a single email with all of them.
+
+    e.g. with EmailDispatcher(address, password, digest=True) as mailer:
+             for ... in sweep:
+                 mailer.send(compose_email(...), receive_addresses)
+         # one digest per recipient sent here
+
+    Parameters:
+    -------------
+    sender_address: str - Email address sent from (and logged into)
+    password: str - Password of sender_address
+    host: str = 'smtp.gmail.com' - SMTP server
+    port: int = 465 - SMTP server port
+    use_ssl: bool = True - Connect with SSL (otherwise plain SMTP, e.g. for a
+        local test server)
+    digest: bool = False - Coalesce emails into one digest per recipient
+    timeout: float = 30 - Seconds to wait on the server
+    """
+
+    def __init__(
+        self,
+        sender_address,
+        password,
+        host="smtp.gmail.com",
+        port=465,
+        use_ssl=True,
+        digest=False,
+        timeout=30,
+    ):
+        self.sender_address = sender_address
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.digest = digest
+        self.timeout = timeout
+
+        self.server = None
+        self.pending = {}  # recipient -> list of emails held for the digest
+        self.n_connections = 0
+        self.n_sent = 0
+
+    def connect(self):
+        """
+        Opens and logs into the SMTP connection if it is not open already
+        """
+
+        if self.server is not None:
+            return self.server
+
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            server = smtplib.SMTP_SSL(
+                self.host, self.port, context=context, timeout=self.timeout
+            )
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        if self.password is not None:
+            server.login(self.sender_address, self.password)
+
+        self.server = server
+        self.n_connections += 1
+
+        return server
+
+    def sendmail(self, message, receive_addresses):
+        """
+        Sends an email now to all receive_addresses, reconnecting once if the
+        server has closed the connection
+        """
+
+        receive_addresses = list(receive_addresses)
+        if len(receive_addresses) == 0:
+            return
+
+        try:
+            self.connect().sendmail(self.sender_address, receive_addresses, message)
+        except smtplib.SMTPServerDisconnected:
+            self.server = None
+            self.connect().sendmail(self.sender_address, receive_addresses, message)
+
+        self.n_sent += 1
+
+    def send(self, message, receive_addresses):
+        """
+        Sends an email to all receive_addresses, or holds it for the digest
+
+        Parameters:
+        -------------
+        message: str or bytes - Email, see compose_email()
+        receive_addresses: list of str - Email addresses of recipients
+
+        Returns:
+        -------------
+        n/a
+        """
+
+        if not self.digest:
+            self.sendmail(message, receive_addresses)
+            return
+
+        for receive_address in receive_addresses:
+            self.pending.setdefault(receive_address, []).append(message)
+
+    def flush(self):
+        """
+        Sends the held emails as one digest per recipient. Recipients holding
+        the same emails share one digest.
+
+        Returns:
+        -------------
+        n_digests: int - Number of digests sent
+        """
+
+        pending = self.pending
+        self.pending = {}
+
+        groups = group_digests(pending)
+        for message, receive_addresses in groups:
+            self.sendmail(message, receive_addresses)
+
+        return len(groups)
+
+    def close(self):
+        """
+        Sends any held digest and closes the connection
+        """
+
+        try:
+            if self.pending:
+                self.flush()
+        finally:
+            self.disconnect()
+
+    def disconnect(self):
+        """
+        Closes the connection, the next email opens a new one
+        """
+
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NotificationQueue:
+    """
+    Delivers emails from a background thread so a slow or failing SMTP
+    server never holds up a sweep; the sweep only enqueues. Every email is
+    written to a spool directory before it is queued and removed once
+    delivered, so emails not yet delivered are sent after a restart.
+    Failed deliveries are retried with exponential backoff and moved to
+    spool/failed/ after max_attempts.
+
+    Emails are sent over the connection of an EmailDispatcher, which only the
+    worker thread uses. Like EmailDispatcher, send() holds emails for one
+    digest per recipient in digest mode, queued on flush().
+
+    e.g. notifications = NotificationQueue(EmailDispatcher(address, password)).start()
+         notifications.send(compose_email(...), receive_addresses)
+         ...
+         notifications.close()
+
+    Parameters:
+    -------------
+    dispatcher: EmailDispatcher - Sends the emails
+    spool_path: str = 'logs/spool/' - Directory emails are kept in until delivered
+    maxsize: int = 1000 - Emails queued in memory (more wait in the spool)
+    max_attempts: int = 5 - Deliveries tried before an email is given up on
+    backoff: float = 2 - Seconds before the first retry, doubled on every retry
+    max_backoff: float = 600 - Longest wait between retries
+    digest: bool = False - Coalesce emails into one digest per recipient
+    """
+
+    def __init__(
+        self,
+        dispatcher,
+        spool_path="logs/spool/",
+        maxsize=1000,
+        max_attempts=5,
+        backoff=2,
+        max_backoff=600,
+        digest=False,
+    ):
+        self.dispatcher = dispatcher
+        self.spool_path = spool_path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.digest = digest
+
+        os.makedirs(os.path.join(spool_path, "failed"), exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.queued = set()  # Spool files in the queue or being delivered
+        self.lock = threading.Lock()
+        self.pending = {}  # recipient -> list of emails held for the digest
+        self.stopping = threading.Event()
+        self.thread = None
+        self.seq = 0
+
+        self.n_sent = 0
+        self.n_retries = 0
+        self.n_failed = 0
+        self.latencies = deque(maxlen=1000)  # Seconds from enqueue to delivery
+
+    # Spool
+
+    def spool_file(self, item):
+        with self.lock:
+            self.seq += 1
+            name = f"{time.time_ns()}-{self.seq}.json"
+
+        filename = os.path.join(self.spool_path, name)
+        with open(f"{filename}.tmp", "w") as f:
+            json.dump(item, f)
+        os.replace(f"{filename}.tmp", filename)
+
+        return filename
+
+    def load_spool(self):
+        """
+        Queues the spooled emails that are due and not queued already
+        """
+
+        now = time.time()
+
+        for name in sorted(os.listdir(self.spool_path)):
+            filename = os.path.join(self.spool_path, name)
+            if not name.endswith(".json") or filename in self.queued:
+                continue
+
+            try:
+                with open(filename, "r") as f:
+                    item = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if item.get("next_attempt", 0) > now:
+                continue
+
+            if not self.put(filename):
+                break
+
+    def put(self, filename):
+        with self.lock:
+            if filename in self.queued:
+                return True
+            try:
+                self.queue.put_nowait(filename)
+            except queue.Full:
+                return False
+            self.queued.add(filename)
+
+        return True
+
+    # Sending
+
+    def enqueue(self, message, receive_addresses):
+        """
+        Spools an email and queues it for delivery, without waiting on it.
+        If the queue is full the email waits in the spool.
+
+        Parameters:
+        -------------
+        message: str or bytes - Email, see compose_email()
+        receive_addresses: list of str - Email addresses of recipients
+
+        Returns:
+        -------------
+        filename: str - Spool file of the email
+        """
+
+        if isinstance(message, bytes):
+            message = message.decode("utf-8")
+
+        item = {
+            "message": message,
+            "receive_addresses": list(receive_addresses),
+            "enqueued": time.time(),
+            "attempts": 0,
+        }
+        filename = self.spool_file(item)
+        self.put(filename)
+
+        return filename
+
+    def send(self, message, receive_addresses):
+        """
+        Queues an email, or holds it for the digest, see EmailDispatcher.send()
+        """
+
+        if not self.digest:
+            self.enqueue(message, receive_addresses)
+            return
+
+        for receive_address in receive_addresses:
+            self.pending.setdefault(receive_address, []).append(message)
+
+    def flush(self):
+        """
+        Queues the held emails as one digest per recipient
+
+        Returns:
+        -------------
+        n_digests: int - Number of digests queued
+        """
+
+        pending = self.pending
+        self.pending = {}
+
+        digests = group_digests(pending)
+        for message, receive_addresses in digests:
+            self.enqueue(message, receive_addresses)
+
+        return len(digests)
+
+    def deliver(self, filename):
+        with open(filename, "r") as f:
+            item = json.load(f)
+
+        try:
+            message = item["message"].encode("utf-8")
+            self.dispatcher.sendmail(message, item["receive_addresses"])
+        except (smtplib.SMTPException, OSError) as e:
+            self.dispatcher.disconnect()
+            item["attempts"] += 1
+            item["error"] = str(e)
+
+            if item["attempts"] >= self.max_attempts:
+                print(
+                    f"Giving up on email {filename} after {item['attempts']} attempts: {e}"
+                )
+                os.replace(
+                    filename,
+                    os.path.join(self.spool_path, "failed", os.path.basename(filename)),
+                )
+                self.n_failed += 1
+                return
+
+            wait = min(self.backoff * 2 ** (item["attempts"] - 1), self.max_backoff)
+            item["next_attempt"] = time.time() + wait
+            with open(f"{filename}.tmp", "w") as f:
+                json.dump(item, f)
+            os.replace(f"{filename}.tmp", filename)
+            self.n_retries += 1
+            return
+
+        os.remove(filename)
+        self.latencies.append(time.time() - item["enqueued"])
+        self.n_sent += 1
+
+    def run(self):
+        # Emails spooled before a restart
+        self.load_spool()
+
+        while True:
+            try:
+                filename = self.queue.get(timeout=1)
+            except queue.Empty:
+                # Retries that are due and emails that did not fit in the queue
+                self.load_spool()
+                if self.stopping.is_set() and self.queue.empty():
+                    break
+                continue
+
+            try:
+                self.deliver(filename)
+            except Exception as e:
+                print(f"Cannot deliver email {filename}: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(filename)
+
+            if self.queue.empty():
+                self.load_spool()
+            if self.queue.empty():
+                self.dispatcher.disconnect()
+
+    def start(self):
+        """
+        Starts the delivery thread
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="medwatch-notifications", daemon=True
+            )
+            self.thread.start()
+
+        return self
+
+    def close(self, timeout=None):
+        """
+        Queues any held digest, waits for queued emails to be delivered (or
+        to wait in the spool for a retry) and stops the delivery thread
+
+        Parameters:
+        -------------
+        timeout: float = None - Most seconds to wait
+        """
+
+        if self.pending:
+            self.flush()
+
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+        self.dispatcher.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self):
+        """
+        Delivery counts and the latency from enqueue to delivery (seconds)
+
+        Returns:
+        -------------
+        stats: dict - Keys 'sent', 'retries', 'failed', 'queued', 'latency_p50',
+            'latency_p95' and 'latency_max'
+        """
+
+        latencies = sorted(self.latencies)
+        stats = {
+            "sent": self.n_sent,
+            "retries": self.n_retries,
+            "failed": self.n_failed,
+            "queued": len(self.queued),
+            "latency_p50": None,
+            "latency_p95": None,
+            "latency_max": None,
+        }
+        if latencies:
+            stats["latency_p50"] = latencies[len(latencies) // 2]
+            stats["latency_p95"] = latencies[
+                min(len(latencies) - 1, int(0.95 * len(latencies)))
+            ]
+            stats["latency_max"] = latencies[-1]
+
+        return stats
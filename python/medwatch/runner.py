@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+
+"""
+Monitors every target group of a YAML config (company press release pages,
+government newsrooms, ...) from one process: all groups share one scheduler,
+one HTTP session, one host limiter, one parser pool and one notification
+queue, and a page listed by several groups is only fetched and parsed once,
+then checked against the keywords of each group and reported to its receivers.
+
+    python -m medwatch.runner ../cfg_eg/medwatch.yaml
+    python -m medwatch.runner ../cfg_eg/medwatch.yaml --group gov
+    python -m medwatch.runner ../cfg_eg/medwatch.yaml --once
+    python -m medwatch.runner ../cfg_eg/medwatch.yaml --group fda --log-dir ../logs_fda/
+
+See cfg_eg/medwatch.yaml for the config format. Relative paths in the config
+are relative to the config file. Processes running groups separately need
+their own log_dir, two processes must not share one.
+"""
+
+import os
+import csv
+import copy
+import time
+import argparse
+import yaml
+
+from datetime import datetime
+
+from .limiter import HostLimiter
+from .notify import EmailDispatcher, NotificationQueue
+from .snapshots import get_snapshot_store
+from .state import StateStore
+from .sweep import ParserPool, check_page, sweep, sweep_report
+from .sysfns import AdaptivePolicy, Scheduler, is_na, load_watched, now_hms
+from .webfns import (
+    LogWriter,
+    anchors_to_message,
+    compose_email,
+    configure_session,
+    get_creds,
+    get_listserv,
+    load_keywords_csv,
+    page_base_url,
+    relevant_anchors,
+    write_log,
+)
+
+DEFAULTS = {
+    "log_dir": "../logs/",  # State, logs and the email spool of every group
+    "start_time": [6, 0, 0],  # Start time of daily sweep (local time)
+    "end_time": [23, 0, 0],  # End time of daily sweep (local time)
+    "interval": 120,  # How often to check each page for updates (in seconds)
+    "site_intervals": {},  # Url -> seconds, for pages checked more or less often
+    "adaptive": True,  # Learn how often each page changes, or AdaptivePolicy settings
+    "concurrency": 20,  # Maximum number of pages fetched at the same time
+    "timeout": 30,  # Seconds before giving up on a page
+    "parser_processes": None,  # None: one per core, 0: parse in the runner process
+    "log_echo": False,  # Print log messages as well as writing them
+    "state_store": False,  # Keep page state in log_dir/medwatch.db, see StateStore
+    "host_limits": {},  # HostLimiter settings, e.g. rate, burst, max_concurrent, groups
+    "email": {
+        "receivers": "../creds/medwatch_receivers.yaml",  # YAML with an 'emails' list
+        "sender_creds": None,  # YAML with username/password, else $EMAIL_USER/$EMAIL_PW
+        "host": "smtp.gmail.com",
+        "port": 465,
+        "use_ssl": True,
+        "digest": False,  # One email per receiver per interval instead of one per page
+    },
+    "groups": {},
+}
+
+GROUP_DEFAULTS = {
+    "companies": None,  # Company list CSV, see load_company_targets()
+    "targets": [],  # Pages given directly, each with 'name', 'url' and 'home'
+    "keywords": None,  # Keywords CSV, see load_keywords_csv()
+    "ignorewords": [],  # Anchors containing these are not relevant
+    "receivers": None,  # Receivers of this group's emails, defaults to email.receivers
+    "interval": None,  # Seconds between checks of this group's pages (not learned)
+}
+
+
+# CONFIG
+
+
+def resolve_path(filename, base):
+    """Path relative to base unless absolute, None stays None"""
+
+    if filename is None or os.path.isabs(filename):
+        return filename
+
+    return os.path.normpath(os.path.join(base, filename))
+
+
+def load_config(filename):
+    """
+    Loads a runner config, filling in defaults and resolving paths relative to
+    the config file
+
+    Parameters:
+    -------------
+    filename: str - YAML config, see cfg_eg/medwatch.yaml
+
+    Returns:
+    -------------
+    config: dict - DEFAULTS updated with the config, with 'groups' mapping each
+        group name to GROUP_DEFAULTS updated with its settings
+    """
+
+    with open(filename, "r") as f:
+        loaded = yaml.safe_load(f) or {}
+
+    unknown = set(loaded) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(
+            f"Unknown settings in {filename}: {', '.join(sorted(unknown))}"
+        )
+
+    config = copy.deepcopy(DEFAULTS)
+    for key, value in loaded.items():
+        if isinstance(config[key], dict) and key != "groups":
+            config[key].update(value or {})
+        else:
+            config[key] = value
+
+    base = os.path.dirname(os.path.abspath(filename))
+    config["log_dir"] = os.path.join(resolve_path(config["log_dir"], base), "")
+    config["email"]["receivers"] = resolve_path(config["email"]["receivers"], base)
+    config["email"]["sender_creds"] = resolve_path(
+        config["email"]["sender_creds"], base
+    )
+
+    groups = {}
+    for name, settings in (config["groups"] or {}).items():
+        group = copy.deepcopy(GROUP_DEFAULTS)
+        group.update(settings or {})
+
+        if group["keywords"] is None:
+            raise ValueError(f"Group {name} in {filename} has no keywords")
+        if group["companies"] is None and not group["targets"]:
+            raise ValueError(f"Group {name} in {filename} has no companies or targets")
+
+        for key in ("companies", "keywords", "receivers"):
+            group[key] = resolve_path(group[key], base)
+
+        groups[name] = group
+
+    if not groups:
+        raise ValueError(f"No groups in {filename}")
+
+    config["groups"] = groups
+
+    return config
+
+
+def load_company_targets(filename):
+    """
+    Press release pages of a company list, see dataprep.create_company_df()
+
+    Parameters:
+    -------------
+    filename: str - Company list CSV
+
+    Returns:
+    -------------
+    targets: dict - Press release url -> (company name, home page url)
+    """
+
+    targets = {}
+    with open(filename) as csvfile:
+        readCSV = csv.reader(csvfile, delimiter=",")
+        next(readCSV)
+
+        for row in readCSV:
+            co, yco, sym, exch, mkcap, size, am, url_home, url_pr = row
+
+            co = co.strip()
+            yco = yco.strip()
+            url_home = url_home.strip()
+            url_pr = url_pr.strip()
+
+            # Skip if entry is n/a for some reason
+            if is_na(url_pr):
+                print(f"[{now_hms()}] Skipping {co}")
+                continue
+
+            targets[url_pr] = (yco, url_home)
+
+    return targets
+
+
+# RUNNER
+
+
+class Runner:
+    """
+    Checks the pages of every target group as they come due and emails the
+    relevant new links found on them. Company lists, keywords and receiver
+    lists are reloaded when their files change.
+
+    e.g. runner = Runner(load_config('../cfg_eg/medwatch.yaml'))
+         try:
+             runner.run()
+         finally:
+             runner.close()
+
+    Parameters:
+    -------------
+    config: dict - See load_config()
+    groups: list of str = None - Names of the groups to run, defaults to all
+    """
+
+    def __init__(self, config, groups=None):
+        if groups is not None:
+            missing = set(groups) - set(config["groups"])
+            if missing:
+                raise ValueError(f"Unknown groups: {', '.join(sorted(missing))}")
+
+        self.config = config
+        self.groups = {
+            name: group
+            for name, group in config["groups"].items()
+            if groups is None or name in groups
+        }
+        self.path = config["log_dir"]
+        os.makedirs(self.path, exist_ok=True)
+
+        # Shared session keeps connections to each host alive across sweeps,
+        # 429/503 responses are left to the host limiter instead of retried
+        configure_session(pool_maxsize=config["concurrency"], retry_throttled=False)
+        self.limiter = HostLimiter(**config["host_limits"])
+        self.parser_pool = ParserPool(processes=config["parser_processes"])
+
+        self.state = None
+        if config["state_store"]:
+            self.state = StateStore(self.path, echo=config["log_echo"]).activate()
+
+        email = config["email"]
+        if email["sender_creds"] is not None:
+            sender_address, password = get_creds(email["sender_creds"])
+        else:
+            sender_address = os.environ.get("EMAIL_USER")
+            password = os.environ.get("EMAIL_PW")
+        dispatcher = EmailDispatcher(
+            sender_address,
+            password,
+            host=email["host"],
+            port=email["port"],
+            use_ssl=email["use_ssl"],
+        )
+        self.notifications = NotificationQueue(
+            dispatcher, spool_path=f"{self.path}spool/", digest=email["digest"]
+        ).start()
+
+        self.scheduler = Scheduler(
+            config["interval"],
+            start_time=config["start_time"],
+            end_time=config["end_time"],
+        )
+        self.policy = None
+        if config["adaptive"]:
+            settings = {"base_interval": config["interval"]}
+            if isinstance(config["adaptive"], dict):
+                settings.update(config["adaptive"])
+            self.policy = AdaptivePolicy(filename=f"{self.path}POLICY.json", **settings)
+
+        self.targets = {}  # url -> list of (group name, name, home page url)
+        self.fixed_intervals = {}  # url -> seconds, for urls not learned by the policy
+        self.last_digest = datetime.now()
+        self.today = datetime.now().date()
+
+    def load_targets(self):
+        """
+        Reloads the pages of every group, a page listed by several groups is
+        checked for each of them and polled at the shortest of their intervals
+
+        Returns:
+        -------------
+        targets: dict - Url -> list of (group name, name, home page url)
+        """
+
+        targets = {}
+        site_intervals = self.config["site_intervals"]
+        fixed_intervals = dict(site_intervals)
+
+        for group_name, group in self.groups.items():
+            pages = {}
+            if group["companies"] is not None:
+                pages.update(load_watched(group["companies"], load_company_targets))
+            for target in group["targets"]:
+                pages[target["url"]] = (target["name"], target.get("home", ""))
+
+            for url, (name, home) in pages.items():
+                targets.setdefault(url, []).append((group_name, name, home))
+                if group["interval"] is not None and url not in site_intervals:
+                    fixed_intervals[url] = min(
+                        fixed_intervals.get(url, group["interval"]), group["interval"]
+                    )
+
+        self.targets = targets
+        self.fixed_intervals = fixed_intervals
+
+        # Pages with a fixed interval are not learned
+        if self.policy is not None:
+            for url in fixed_intervals:
+                self.policy.forget(url)
+
+        return targets
+
+    def intervals(self):
+        """Interval of every page, fixed or learned by the policy"""
+
+        intervals = dict(self.fixed_intervals)
+        if self.policy is not None:
+            for url in self.targets:
+                if url not in intervals:
+                    intervals[url] = self.policy.interval(url)
+
+        return intervals
+
+    def sweep(self, urls):
+        """
+        Fetches urls, parses them in the parser pool and handles the results
+
+        Parameters:
+        -------------
+        urls: list of str - Urls to check, all in self.targets
+
+        Returns:
+        -------------
+        results: list of dict - See fetch_page()
+        wall_time: float - Seconds the sweep took
+        """
+
+        config = self.config
+
+        # Fetch the pages that are due concurrently, unchanged pages come back as 304s
+        results, wall_time = sweep(
+            urls,
+            concurrency=config["concurrency"],
+            timeout=config["timeout"],
+            conditional=True,
+            path=self.path,
+            limiter=self.limiter,
+            decode=False,
+        )
+
+        # Each page is parsed once, in the parser pool, against the keywords of
+        # its first group; the anchors of a page in several groups are then
+        # matched against the keywords of the others here
+        keywords = {}
+        analyses = [{} for url in urls]  # Group name -> analysis, per url
+        for group_name, group in self.groups.items():
+            keywords[group_name] = load_watched(group["keywords"], load_keywords_csv)
+            indices = [
+                i for i, url in enumerate(urls) if self.targets[url][0][0] == group_name
+            ]
+            if not indices:
+                continue
+
+            group_analyses = self.parser_pool.analyze(
+                [results[i] for i in indices],
+                keywords[group_name],
+                ignorewords=group["ignorewords"],
+                path=self.path,
+            )
+            for i, analysis in zip(indices, group_analyses):
+                analyses[i][group_name] = analysis
+
+        for url, group_analyses in zip(urls, analyses):
+            analysis = next(iter(group_analyses.values()))
+            for group_name, _, _ in self.targets[url][1:]:
+                if analysis is None or analysis["anchors"] is None:
+                    group_analyses[group_name] = analysis
+                    continue
+
+                rel_anchors, rel_keywords = relevant_anchors(
+                    analysis["anchors"],
+                    keywords=keywords[group_name],
+                    ignorewords=self.groups[group_name]["ignorewords"],
+                )
+                group_analyses[group_name] = dict(
+                    analysis, relevant=dict(zip(rel_anchors, rel_keywords))
+                )
+
+        # Log records are buffered and written to log_dir/LOG.jsonl at the end of
+        # the sweep (or to the state store if it is active)
+        with LogWriter(echo=config["log_echo"]) as log_writer:
+            for url, result, group_analyses in zip(urls, results, analyses):
+                self.check(url, result, group_analyses, keywords, log_writer)
+
+        if self.state is not None:
+            self.state.commit()
+
+        return results, wall_time
+
+    def check(self, url, result, analyses, keywords, log_writer):
+        """
+        Handles the result of one page: logs errors, runs check_page() and
+        queues an email to each group with relevant new links
+
+        Parameters:
+        -------------
+        url: str - Url of the page, in self.targets
+        result: dict - See fetch_page()
+        analyses: dict - Group name -> analyze_page() of the page for each of its groups
+        keywords: dict - Group name -> keywords of the group
+        log_writer: LogWriter - Writer the sweep's log records are buffered in
+        """
+
+        targets = self.targets[url]
+        name = targets[0][1]
+        learned = self.policy is not None and url not in self.fixed_intervals
+        # Pages checked with --once are not in the scheduler
+        scheduled = learned and url in self.scheduler
+
+        # Per page output only with log_echo, the sweep report lists every page
+        if self.config["log_echo"]:
+            print("\n----------------------------------")
+            print(f"[{result['time_requested']}] Checking {name}")
+
+        # Held back by the host limits, checked again when next due
+        if result["deferred"]:
+            write_log(result["error"], url, path=self.path, event="deferred")
+            return
+
+        if result["error"] is not None:
+            message = f"CONNECTION FAILED! - {result['error']}\n"
+            write_log(message, url, path=self.path, event="error")
+            return
+
+        if result["not_modified"]:
+            message = f"[{now_hms()}] No update from {url} (304 Not Modified) \n"
+            write_log(message, url, path=self.path, event="not_modified")
+            if learned:
+                interval = self.policy.observe(url, False)
+                if scheduled:
+                    self.scheduler.set_interval(url, interval)
+            return
+
+        # The page's state is updated once, with the anchors relevant to any
+        # of its groups; the new ones are then split by group
+        analysis = dict(next(iter(analyses.values())))
+        relevant = {}
+        for group_analysis in analyses.values():
+            for anchor, anchor_keywords in group_analysis["relevant"].items():
+                relevant.setdefault(anchor, [])
+                relevant[anchor] += [
+                    kw for kw in anchor_keywords if kw not in relevant[anchor]
+                ]
+        analysis["relevant"] = relevant
+
+        time_requested = result["time_requested"]
+        rel_anchors, _ = check_page(
+            url,
+            None,
+            [],
+            path=self.path,
+            validators=result["validators"],
+            # Pages with a fixed interval are not learned, nor kept in POLICY.json
+            policy=self.policy if learned else None,
+            analysis=analysis,
+        )
+        if scheduled:
+            self.scheduler.set_interval(url, self.policy.interval(url))
+
+        if len(rel_anchors) == 0:
+            return
+
+        message = (
+            f"[{time_requested}] New links found: \n---------------\n{rel_anchors}\n"
+        )
+        write_log(message, url, path=self.path, event="new_links", anchors=rel_anchors)
+
+        # Detection is on disk before the emails go out
+        log_writer.flush()
+
+        # Links resolved against the page they were found on, no requests made
+        base_url = page_base_url(analysis["page"], result["final_url"])
+        for group_name, name, home in targets:
+            group_relevant = analyses[group_name]["relevant"]
+            group_anchors = [
+                anchor for anchor in rel_anchors if anchor in group_relevant
+            ]
+            if len(group_anchors) == 0:
+                continue
+
+            email_body = anchors_to_message(
+                group_anchors,
+                [group_relevant[anchor] for anchor in group_anchors],
+                url,
+                home,
+                path=self.path,
+                base_url=base_url,
+            )
+            email_msg = compose_email(
+                email_body,
+                name,
+                home,
+                url,
+                time_requested=time_requested,
+                keywords=keywords[group_name],
+            )
+
+            group = self.groups[group_name]
+            receivers = group["receivers"] or self.config["email"]["receivers"]
+            self.notifications.send(email_msg, get_listserv(receivers))
+
+    def housekeeping(self):
+        """
+        Queues digests and saves learned intervals once every interval, and
+        drops aged out page snapshots once a day
+        """
+
+        if (datetime.now() - self.last_digest).total_seconds() >= self.config[
+            "interval"
+        ]:
+            self.notifications.flush()
+            if self.policy is not None:
+                self.policy.save()
+            self.last_digest = datetime.now()
+
+        if datetime.now().date() != self.today:
+            self.today = datetime.now().date()
+            if self.state is not None:
+                self.state.collect_garbage()
+            else:
+                get_snapshot_store(self.path).collect_garbage()
+
+    def run(self, once=False):
+        """
+        Checks pages as they come due, forever
+
+        Parameters:
+        -------------
+        once: bool = False - Check every page once, now, and return
+        """
+
+        print(f"Beginning {datetime.now()}")
+
+        while True:
+            # Company lists reloaded only if the files changed
+            self.load_targets()
+
+            if once:
+                urls = list(self.targets)
+            else:
+                self.scheduler.sync(self.targets, intervals=self.intervals())
+
+                next_due = self.scheduler.next_due()
+                if next_due is not None and next_due.date() != datetime.now().date():
+                    print(f"Done for the day, will start at {next_due}")
+
+                # Sleep until pages are due
+                urls = [url for url in self.scheduler.wait() if url in self.targets]
+
+            # Nothing scheduled (e.g. empty company lists), the targets are
+            # reloaded after an interval instead of sweeping nothing
+            if not urls:
+                if once:
+                    return
+                if not self.targets:
+                    print(f"[{now_hms()}] No pages to check")
+                self.housekeeping()
+                time.sleep(self.config["interval"])
+                continue
+
+            results, wall_time = self.sweep(urls)
+            self.housekeeping()
+
+            print(sweep_report(results, wall_time, limiter=self.limiter))
+            print("-----------------\nSweep Complete")
+
+            if once:
+                return
+
+    def close(self):
+        """
+        Delivers queued emails and releases the parser pool and state store
+        """
+
+        self.notifications.flush()
+        self.notifications.close()
+        self.parser_pool.close()
+        if self.policy is not None:
+            self.policy.save()
+        if self.state is not None:
+            self.state.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("config", help="YAML config, see cfg_eg/medwatch.yaml")
+    parser.add_argument(
+        "--group",
+        action="append",
+        help="only run this group (repeatable), defaults to all groups",
+    )
+    parser.add_argument(
+        "--log-dir",
+        help="log_dir to use instead of the config's, e.g. for groups run in "
+        "separate processes",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="check every page once and exit"
+    )
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.log_dir is not None:
+        config["log_dir"] = os.path.join(os.path.abspath(args.log_dir), "")
+
+    runner = Runner(config, groups=args.group)
+    try:
+        runner.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    main()
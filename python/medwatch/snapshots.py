@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import json
+import time
+import hashlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, snapshots fall back to gzip
+    zstandard = None
+
+_SNAPSHOT_STORES = {}  # Snapshot stores by log path, see get_snapshot_store()
+
+
+# PAGE SNAPSHOTS
+
+
+class SnapshotStore:
+    """
+    Content-addressed history of cached pages. Each snapshot is compressed
+    (zstd if zstandard is installed, otherwise gzip) and saved once under the
+    hash of its content, so identical snapshots of a page, or of different
+    pages, share one object. Each page has a SNAPSHOTS file pointing to its
+    versions, newest last, which is trimmed to the last max_versions versions
+    no older than retention_days (the newest is always kept), and a small
+    LATEST file with its newest version so that checking a page does not read
+    its whole history.
+
+    Objects no page points to any more are deleted by collect_garbage().
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Path where SNAPSHOTS/LATEST files and the snapshots/ directory are saved
+    retention_days: float = 28 - Days versions of a page are kept
+    max_versions: int = 1000 - Versions of a page kept
+    """
+
+    def __init__(self, path="logs/", retention_days=28, max_versions=1000):
+        self.path = path
+        self.objects_path = os.path.join(path, "snapshots")
+        self.retention_days = retention_days
+        self.max_versions = max_versions
+
+    def history_filename(self, key):
+        return f"{self.path}SNAPSHOTS-{key}.json"
+
+    def latest_filename(self, key):
+        return f"{self.path}LATEST-{key}.json"
+
+    def object_filename(self, address, ext):
+        return os.path.join(self.objects_path, address[:2], f"{address}{ext}")
+
+    def history(self, key):
+        """
+        Versions of a page, oldest first
+
+        Parameters:
+        -------------
+        key: str - Name of the page, see webfns.url_to_filename()
+
+        Returns:
+        -------------
+        versions: list of dict - Keys 'time' (unix time), 'object' (content hash)
+            and 'digest' (see webfns.page_digest())
+        """
+
+        filename = self.history_filename(key)
+        if not os.path.isfile(filename):
+            return []
+
+        with open(filename, "r") as f:
+            return json.load(f)
+
+    def latest(self, key):
+        """Newest version of a page (see history()), None if none stored"""
+
+        filename = self.latest_filename(key)
+        if os.path.isfile(filename):
+            with open(filename, "r") as f:
+                return json.load(f)
+
+        # Pages stored before LATEST files were kept
+        versions = self.history(key)
+        return versions[-1] if versions else None
+
+    def put(self, key, data, digest):
+        """
+        Stores a snapshot of a page as its newest version
+
+        Parameters:
+        -------------
+        key: str - Name of the page, see webfns.url_to_filename()
+        data: str - Html content of the page
+        digest: str - Digest of the page, see webfns.page_digest()
+
+        Returns:
+        -------------
+        address: str - Content hash the snapshot is saved under
+        """
+
+        address = self.put_object(data)
+
+        now = time.time()
+        versions = self.history(key)
+        if versions and versions[-1]["object"] == address:
+            versions[-1]["time"] = now
+        else:
+            versions.append({"time": now, "object": address, "digest": digest})
+
+        versions = self.trim(versions, now)
+
+        for filename, value in (
+            (self.history_filename(key), versions),
+            (self.latest_filename(key), versions[-1]),
+        ):
+            with open(f"{filename}.tmp", "w") as f:
+                json.dump(value, f)
+            os.replace(f"{filename}.tmp", filename)
+
+        return address
+
+    def trim(self, versions, now=None):
+        """
+        Versions of a page within the retention limits: the last max_versions
+        no older than retention_days, always keeping the newest
+
+        Parameters:
+        -------------
+        versions: list of dict - Versions of a page, oldest first, see history()
+        now: float = None - Unix time the age of versions is measured at
+
+        Returns:
+        -------------
+        versions: list of dict
+        """
+
+        if not versions:
+            return versions
+
+        if now is None:
+            now = time.time()
+
+        oldest = now - 24 * 3600 * self.retention_days
+        newest = versions[-1]
+        versions = [version for version in versions[:-1] if version["time"] >= oldest]
+
+        return (versions + [newest])[-self.max_versions :]
+
+    def put_object(self, data):
+        """
+        Saves a snapshot under the hash of its content, without adding it to
+        the history of a page (see put()). Identical snapshots are only saved once
+
+        Parameters:
+        -------------
+        data: str - Html content of a page
+
+        Returns:
+        -------------
+        address: str - Content hash the snapshot is saved under
+        """
+
+        raw = data.encode("utf-8")
+        address = hashlib.sha256(raw).hexdigest()
+
+        if self.find_object(address) is None:
+            ext = ".zst" if zstandard is not None else ".gz"
+            filename = self.object_filename(address, ext)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+            if zstandard is not None:
+                compressed = zstandard.ZstdCompressor(level=10).compress(raw)
+            else:
+                compressed = gzip.compress(raw, compresslevel=6)
+
+            with open(f"{filename}.tmp", "wb") as f:
+                f.write(compressed)
+            os.replace(f"{filename}.tmp", filename)
+
+        return address
+
+    def find_object(self, address):
+        for ext in (".zst", ".gz"):
+            filename = self.object_filename(address, ext)
+            if os.path.isfile(filename):
+                return filename
+
+        return None
+
+    def get(self, address):
+        """
+        Loads a snapshot by its content hash
+
+        Parameters:
+        -------------
+        address: str - Content hash, see history()
+
+        Returns:
+        -------------
+        data: str - Html content of the page, None if the object is missing
+        """
+
+        filename = self.find_object(address)
+        if filename is None:
+            return None
+
+        with open(filename, "rb") as f:
+            compressed = f.read()
+
+        if filename.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError(f"zstandard is needed to read {filename}")
+            raw = zstandard.ZstdDecompressor().decompress(compressed)
+        else:
+            raw = gzip.decompress(compressed)
+
+        return raw.decode("utf-8")
+
+    def collect_garbage(self, referenced=()):
+        """
+        Trims the history of every page to the retention limits, including
+        pages no longer checked, then deletes the snapshots no page points to
+        any more
+
+        Parameters:
+        -------------
+        referenced: iterable of str = () - Addresses also in use, e.g. the
+            snapshots of a StateStore
+
+        Returns:
+        -------------
+        n_deleted: int - Number of snapshots deleted
+        """
+
+        referenced = set(referenced)
+        for filename in os.listdir(self.path or "."):
+            if filename.startswith("SNAPSHOTS-") and filename.endswith(".json"):
+                key = filename[len("SNAPSHOTS-") : -len(".json")]
+                versions = self.history(key)
+                trimmed = self.trim(versions)
+                if len(trimmed) < len(versions):
+                    filename = self.history_filename(key)
+                    with open(f"{filename}.tmp", "w") as f:
+                        json.dump(trimmed, f)
+                    os.replace(f"{filename}.tmp", filename)
+
+                referenced.update(version["object"] for version in trimmed)
+
+        n_deleted = 0
+        if not os.path.isdir(self.objects_path):
+            return n_deleted
+
+        for prefix in os.listdir(self.objects_path):
+            prefix_path = os.path.join(self.objects_path, prefix)
+            for filename in os.listdir(prefix_path):
+                address = filename.split(".")[0]
+                if address not in referenced:
+                    os.remove(os.path.join(prefix_path, filename))
+                    n_deleted += 1
+
+        return n_deleted
+
+
+def get_snapshot_store(path="logs/"):
+    """
+    Returns the snapshot store of a log path, creating it on first use
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Log path
+
+    Returns:
+    -------------
+    store: SnapshotStore
+    """
+
+    if path not in _SNAPSHOT_STORES:
+        _SNAPSHOT_STORES[path] = SnapshotStore(path)
+
+    return _SNAPSHOT_STORES[path]
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+from datetime import datetime
+from itertools import groupby
+
+from .snapshots import get_snapshot_store
+
+_STATE_STORES = {}  # Active stores by log path, see StateStore.activate()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT,
+    object TEXT,
+    snapshot BLOB,
+    validators TEXT,
+    fingerprints TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    time REAL NOT NULL,
+    object TEXT NOT NULL,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_url_time ON snapshots (url, time);
+CREATE TABLE IF NOT EXISTS anchors (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    time REAL NOT NULL,
+    href TEXT,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS anchors_url_time ON anchors (url, time);
+CREATE INDEX IF NOT EXISTS anchors_time ON anchors (time);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    time REAL NOT NULL,
+    event TEXT,
+    message TEXT,
+    anchors TEXT
+);
+CREATE INDEX IF NOT EXISTS events_url_time ON events (url, time);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+"""
+
+
+# MONITOR STATE
+
+
+def to_timestamp(since):
+    """Unix time of a datetime (local time if naive), or since if already a number"""
+
+    if isinstance(since, datetime):
+        return since.timestamp()
+
+    return since
+
+
+class StateStore:
+    """
+    Keeps the state of every monitored page in one SQLite database instead of
+    the CACHE, DIGEST, VALIDATORS, FINGERPRINTS, ANCHORS and LOG files of each
+    url. Snapshots are saved in the content-addressed objects of the path's
+    SnapshotStore, with the versions of each page (kept as long as the
+    SnapshotStore keeps them) in the snapshots table. Writes are committed in
+    batches (every batch_size writes and on commit()/close()) in WAL mode so
+    readers are never blocked.
+
+    Once activated, the state functions of webfns (load_cache(), store_cache(),
+    store_anchors(), write_log(), ...) called with the same path read and
+    write the store instead of files.
+
+    e.g. with StateStore('logs/'):
+             check_page(url, page, keywords, path='logs/')
+         StateStore('logs/').changes_since(datetime(2020, 7, 1))
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Log path the store is used for
+    filename: str = None - Database file, defaults to path + 'medwatch.db'
+    batch_size: int = 500 - Writes made before they are committed
+    echo: bool = True - Print log messages as well as storing them
+    """
+
+    def __init__(self, path="logs/", filename=None, batch_size=500, echo=True):
+        if filename is None:
+            filename = f"{path}medwatch.db"
+
+        self.path = path
+        self.filename = filename
+        self.batch_size = batch_size
+        self.echo = echo
+        self.n_pending = 0
+        self.lock = threading.RLock()
+
+        # Used from the threads of a sweep as well, always under self.lock
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        # Databases made before snapshots were versioned kept one blob per page
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(pages)")]
+        if "object" not in columns:
+            self.db.execute("ALTER TABLE pages ADD COLUMN object TEXT")
+        self.db.commit()
+
+        self.snapshots = get_snapshot_store(path)
+
+    # Transactions
+
+    def _write(self, sql, params=()):
+        with self.lock:
+            self.db.execute(sql, params)
+            self.n_pending += 1
+            if self.n_pending >= self.batch_size:
+                self.commit()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _page_value(self, url, column):
+        rows = self._query(f"SELECT {column} FROM pages WHERE url = ?", (url,))
+        return rows[0][0] if rows else None
+
+    def _set_page_value(self, url, column, value):
+        self._write(
+            f"INSERT INTO pages (url, {column}, updated) VALUES (?, ?, ?) "
+            f"ON CONFLICT (url) DO UPDATE SET {column} = excluded.{column}, "
+            "updated = excluded.updated",
+            (url, value, time.time()),
+        )
+
+    def commit(self):
+        """
+        Commits the writes made since the last commit
+        """
+
+        with self.lock:
+            self.db.commit()
+            self.n_pending = 0
+
+    def activate(self):
+        """
+        Makes the webfns state functions called with this store's path use it
+        """
+
+        _STATE_STORES[self.path] = self
+        return self
+
+    def close(self):
+        """
+        Commits, deactivates and closes the store
+        """
+
+        if _STATE_STORES.get(self.path) is self:
+            del _STATE_STORES[self.path]
+
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Pages
+
+    def has_cache(self, url):
+        return self._page_value(url, "object IS NOT NULL OR snapshot IS NOT NULL") == 1
+
+    def load_cache(self, url):
+        rows = self._query("SELECT object, snapshot FROM pages WHERE url = ?", (url,))
+        if not rows:
+            return None
+
+        address, snapshot = rows[0]
+        if address is not None:
+            data = self.snapshots.get(address)
+            if data is not None:
+                return data
+
+        # Pages stored before snapshots were versioned
+        if snapshot is None:
+            return None
+
+        return zlib.decompress(snapshot).decode("utf-8")
+
+    def store_cache(self, url, data, digest):
+        address = self.snapshots.put_object(data)
+        now = time.time()
+
+        with self.lock:
+            rows = self._query(
+                "SELECT id, object FROM snapshots WHERE url = ? "
+                "ORDER BY time DESC, id DESC LIMIT 1",
+                (url,),
+            )
+            if rows and rows[0][1] == address:
+                self._write(
+                    "UPDATE snapshots SET time = ? WHERE id = ?", (now, rows[0][0])
+                )
+            else:
+                self._write(
+                    "INSERT INTO snapshots (url, time, object, digest) VALUES (?, ?, ?, ?)",
+                    (url, now, address, digest),
+                )
+
+            self._trim_snapshots(url, now)
+
+            self._write(
+                "INSERT INTO pages (url, digest, object, snapshot, updated) "
+                "VALUES (?, ?, ?, NULL, ?) ON CONFLICT (url) DO UPDATE SET "
+                "digest = excluded.digest, object = excluded.object, "
+                "snapshot = NULL, updated = excluded.updated",
+                (url, digest, address, now),
+            )
+
+    def _trim_snapshots(self, url=None, now=None):
+        # Retention limits of the SnapshotStore (see SnapshotStore.trim()), for
+        # one page or all of them, always keeping the newest version of each
+        if now is None:
+            now = time.time()
+
+        where, params = "", []
+        if url is not None:
+            where, params = "WHERE url = ?", [url]
+
+        self._write(
+            "DELETE FROM snapshots WHERE id IN (SELECT id FROM (SELECT id, time, "
+            "ROW_NUMBER() OVER (PARTITION BY url ORDER BY time DESC, id DESC) AS n "
+            f"FROM snapshots {where}) WHERE n > 1 AND (n > ? OR time < ?))",
+            params
+            + [
+                self.snapshots.max_versions,
+                now - 24 * 3600 * self.snapshots.retention_days,
+            ],
+        )
+
+    def history(self, url):
+        """
+        Versions of a page, oldest first, see SnapshotStore.history()
+        """
+
+        rows = self._query(
+            "SELECT time, object, digest FROM snapshots WHERE url = ? ORDER BY time, id",
+            (url,),
+        )
+
+        return [
+            {"time": t, "object": address, "digest": digest}
+            for t, address, digest in rows
+        ]
+
+    def collect_garbage(self):
+        """
+        Trims the versions of every page to the retention limits, including
+        pages no longer checked, then deletes the snapshot objects no page of
+        the store (or of the path's SNAPSHOTS files) points to any more
+
+        Returns:
+        -------------
+        n_deleted: int - Number of snapshots deleted
+        """
+
+        with self.lock:
+            self._trim_snapshots()
+            self.commit()
+
+            referenced = [row[0] for row in self._query("SELECT object FROM snapshots")]
+            referenced += [
+                row[0]
+                for row in self._query(
+                    "SELECT object FROM pages WHERE object IS NOT NULL"
+                )
+            ]
+
+            return self.snapshots.collect_garbage(referenced=referenced)
+
+    def load_digest(self, url):
+        return self._page_value(url, "digest")
+
+    def store_digest(self, url, digest):
+        self._set_page_value(url, "digest", digest)
+
+    def load_validators(self, url):
+        validators = self._page_value(url, "validators")
+        return {} if validators is None else json.loads(validators)
+
+    def store_validators(self, url, validators):
+        self._set_page_value(
+            url, "validators", json.dumps(validators) if validators else None
+        )
+
+    def load_anchor_index(self, url):
+        fingerprints = self._page_value(url, "fingerprints")
+        return None if fingerprints is None else set(json.loads(fingerprints))
+
+    def store_anchor_index(self, url, fingerprints):
+        self._set_page_value(url, "fingerprints", json.dumps(sorted(set(fingerprints))))
+
+    # Anchors and events
+
+    def store_anchors(self, url, anchors):
+        """
+        Adds a batch of (href, content) anchors found on url
+        """
+
+        now = time.time()
+        with self.lock:
+            for href, content in anchors:
+                self._write(
+                    "INSERT INTO anchors (url, time, href, content) VALUES (?, ?, ?, ?)",
+                    (url, now, href, content),
+                )
+
+    def read_anchors(self, url):
+        """
+        Yields the anchor batches of url oldest first, see webfns.read_anchors()
+        """
+
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT time, href, content FROM anchors WHERE url = ? ORDER BY time, id",
+                (url,),
+            ).fetchall()
+
+        for batch_time, batch in groupby(rows, key=lambda row: row[0]):
+            yield {
+                "time": datetime.fromtimestamp(batch_time).isoformat(
+                    timespec="seconds"
+                ),
+                "anchors": [(href, content) for _, href, content in batch],
+            }
+
+    def write_event(self, url, message, event="message", anchors=None):
+        """
+        Records a log message, see webfns.write_log()
+        """
+
+        if self.echo:
+            print(message)
+
+        self._write(
+            "INSERT INTO events (url, time, event, message, anchors) VALUES (?, ?, ?, ?, ?)",
+            (
+                url,
+                time.time(),
+                event,
+                message.strip(),
+                None if anchors is None else json.dumps(anchors),
+            ),
+        )
+
+    # Queries
+
+    def changes_since(self, since, url=None):
+        """
+        Relevant anchors found since a given time, newest first
+
+        e.g. store.changes_since(datetime.now().replace(hour=0, minute=0))
+             returns what changed today
+
+        Parameters:
+        -------------
+        since: datetime or float - Local datetime or unix time
+        url: str = None - Only anchors of this url
+
+        Returns:
+        -------------
+        changes: list of dict - Keys 'url', 'time' (datetime), 'href' and 'content'
+        """
+
+        sql = "SELECT url, time, href, content FROM anchors WHERE time >= ?"
+        params = [to_timestamp(since)]
+        if url is not None:
+            sql += " AND url = ?"
+            params.append(url)
+
+        rows = self._query(sql + " ORDER BY time DESC, id", params)
+
+        return [
+            {
+                "url": url,
+                "time": datetime.fromtimestamp(t),
+                "href": href,
+                "content": content,
+            }
+            for url, t, href, content in rows
+        ]
+
+    def events_since(self, since, event=None, url=None):
+        """
+        Log records written since a given time, oldest first
+
+        Parameters:
+        -------------
+        since: datetime or float - Local datetime or unix time
+        event: str = None - Only events of this kind (e.g. 'update')
+        url: str = None - Only events of this url
+
+        Returns:
+        -------------
+        events: list of dict - Keys 'url', 'time' (datetime), 'event', 'message'
+            and 'anchors'
+        """
+
+        sql = "SELECT url, time, event, message, anchors FROM events WHERE time >= ?"
+        params = [to_timestamp(since)]
+        if event is not None:
+            sql += " AND event = ?"
+            params.append(event)
+        if url is not None:
+            sql += " AND url = ?"
+            params.append(url)
+
+        rows = self._query(sql + " ORDER BY time, id", params)
+
+        return [
+            {
+                "url": url,
+                "time": datetime.fromtimestamp(t),
+                "event": event,
+                "message": message,
+                "anchors": None if anchors is None else json.loads(anchors),
+            }
+            for url, t, event, message, anchors in rows
+        ]
+
+
+def active_store(path="logs/"):
+    """
+    Returns the StateStore activated for path, None if state is kept in files
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Log path
+
+    Returns:
+    -------------
+    store: StateStore or None
+    """
+
+    return _STATE_STORES.get(path)
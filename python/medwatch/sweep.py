@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import asyncio
+import time
+import requests
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from .sysfns import now_hms
+from .webfns import (
+    TIMEOUT,
+    anchor_fingerprint,
+    cache_updated,
+    conditional_headers,
+    extract_anchors,
+    get_body,
+    get_session,
+    load_digest,
+    new_anchors,
+    page_digest,
+    relevant_anchors,
+    response_validators,
+    store_anchors,
+    store_cache,
+    store_validators,
+    write_log,
+)
+
+# CONCURRENT SWEEPS OF MONITORED WEBPAGES
+
+
+def fetch_page(
+    url,
+    timeout=TIMEOUT,
+    session=None,
+    conditional=False,
+    path="logs/",
+    limiter=None,
+    decode=True,
+):
+    """
+    Requests a webpage and records how long the request took. Errors,
+    including error responses (4xx/5xx), are recorded in the result instead of
+    being raised so that one bad site does not stop a sweep. In conditional mode the stored validators of the page are
+    sent so an unchanged page comes back as an empty 304 Not Modified. With a
+    limiter the request waits for its host, and is deferred (not sent) if the
+    host is not available within limiter.max_wait seconds. Without decoding,
+    the raw bytes of the page are kept for analyze_page() to decode instead.
+
+    Parameters:
+    -------------
+    url: str - Url of the page to fetch
+    timeout: float = TIMEOUT - Seconds to wait on connecting/reading before giving up
+    session: requests.Session = None - Session to use, defaults to get_session()
+    conditional: bool = False - Send If-None-Match/If-Modified-Since headers
+    path: str = 'logs/' - Path CACHE and VALIDATORS files are located
+    limiter: HostLimiter = None - Per-host rate limits, see HostLimiter
+    decode: bool = True - Decode the page into 'page', otherwise keep its bytes in 'content'
+
+    Returns:
+    -------------
+    result: dict - Keys are 'url', 'final_url' (after redirects), 'status', 'page',
+        'content' and 'encoding' (raw page when not decoded), 'error', 'latency'
+        (seconds), 'time_requested' (formatted datetime), 'not_modified' (True
+        on a 304), 'validators' (ETag/Last-Modified of the response) and
+        'deferred' (True if the limiter held the request back) and 'wait_time'
+        (seconds waited for the limiter, not part of the latency)
+    """
+
+    if session is None:
+        session = get_session()
+
+    time_requested = datetime.now().strftime("%a, %d %b %Y %H:%M:%S")
+    result = {
+        "url": url,
+        "final_url": url,
+        "status": None,
+        "page": None,
+        "content": None,
+        "encoding": None,
+        "error": None,
+        "latency": None,
+        "time_requested": time_requested,
+        "not_modified": False,
+        "validators": {},
+        "deferred": False,
+        "wait_time": 0.0,
+    }
+
+    headers = {}
+    if conditional:
+        headers = conditional_headers(url, path=path)
+
+    start = time.perf_counter()
+    if limiter is not None:
+        acquired = limiter.acquire(url)
+        result["wait_time"] = time.perf_counter() - start
+        if not acquired:
+            result["error"] = f"Deferred, {limiter.key(url)} is rate limited"
+            result["deferred"] = True
+            result["latency"] = 0.0
+            return result
+
+    # Latency of the request itself, not of waiting for its host
+    start = time.perf_counter()
+    r = None
+    try:
+        r = session.get(url, headers=headers, timeout=timeout)
+        result["status"] = r.status_code
+        result["final_url"] = r.url
+        result["not_modified"] = r.status_code == 304
+        result["validators"] = response_validators(r)
+        # Error pages are not snapshots of the page, they are never cached
+        if r.status_code != 304 and not 200 <= r.status_code < 300:
+            result["error"] = f"{r.status_code} {r.reason}"
+        elif decode:
+            result["page"] = r.text
+        else:
+            result["content"] = r.content
+            result["encoding"] = r.encoding
+    except requests.RequestException as e:
+        result["error"] = str(e)
+    finally:
+        if limiter is not None:
+            limiter.release(url, r)
+
+    result["latency"] = time.perf_counter() - start
+
+    return result
+
+
+async def sweep_async(
+    urls,
+    concurrency=20,
+    timeout=TIMEOUT,
+    session=None,
+    conditional=False,
+    path="logs/",
+    limiter=None,
+    decode=True,
+):
+    """
+    Fetches all urls concurrently with at most `concurrency` requests in
+    flight at a time. Each request is abandoned if it takes longer than
+    `timeout` seconds in total. With a limiter, urls wait for their host
+    before taking one of the `concurrency` slots, so a busy host does not hold
+    up the others.
+
+    Parameters:
+    -------------
+    urls: list of str - Urls to fetch
+    concurrency: int = 20 - Maximum number of requests in flight
+    timeout: float = TIMEOUT - Seconds before a request is abandoned
+    session: requests.Session = None - Session to use, defaults to get_session().
+        Its pool_maxsize should be at least concurrency to keep connections alive
+    conditional: bool = False - Send stored validators, see fetch_page()
+    path: str = 'logs/' - Path CACHE and VALIDATORS files are located
+    limiter: HostLimiter = None - Per-host rate limits, see HostLimiter
+    decode: bool = True - Decode pages, see fetch_page()
+
+    Returns:
+    -------------
+    results: list of dict - One result per url (same order as urls), see fetch_page()
+    """
+
+    if session is None:
+        session = get_session()
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    # Hosts are looked up (with by_ip) off the event loop before any request
+    if limiter is not None:
+        await loop.run_in_executor(executor, limiter.resolve, urls)
+
+    async def _fetch(url):
+        wait_time = 0.0
+        if limiter is not None:
+            # Wait out the host's limits here rather than in a worker thread
+            waited_from = loop.time()
+            deadline = waited_from + limiter.max_wait
+            delay = limiter.delay(url)
+            while 0 < delay and loop.time() < deadline:
+                await asyncio.sleep(min(delay, deadline - loop.time(), 1))
+                delay = limiter.delay(url)
+            wait_time = loop.time() - waited_from
+
+        async with semaphore:
+            start = time.perf_counter()
+            future = loop.run_in_executor(
+                executor,
+                fetch_page,
+                url,
+                timeout,
+                session,
+                conditional,
+                path,
+                limiter,
+                decode,
+            )
+            try:
+                result = await asyncio.wait_for(future, timeout)
+                result["wait_time"] += wait_time
+                return result
+            except asyncio.TimeoutError:
+                return {
+                    "url": url,
+                    "final_url": url,
+                    "status": None,
+                    "page": None,
+                    "content": None,
+                    "encoding": None,
+                    "error": f"Timed out after {timeout} seconds",
+                    "latency": time.perf_counter() - start,
+                    "time_requested": datetime.now().strftime("%a, %d %b %Y %H:%M:%S"),
+                    "not_modified": False,
+                    "validators": {},
+                    "deferred": False,
+                    "wait_time": wait_time,
+                }
+
+    try:
+        results = await asyncio.gather(*[_fetch(url) for url in urls])
+    finally:
+        # Do not wait on requests that were abandoned
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return list(results)
+
+
+def sweep(
+    urls,
+    concurrency=20,
+    timeout=TIMEOUT,
+    session=None,
+    conditional=False,
+    path="logs/",
+    limiter=None,
+    decode=True,
+):
+    """
+    Blocking wrapper of sweep_async() that also times the whole sweep
+
+    e.g. results, wall_time = sweep(['https://www.fda.gov', 'https://www.who.int'])
+
+    Parameters:
+    -------------
+    urls: list of str - Urls to fetch
+    concurrency: int = 20 - Maximum number of requests in flight
+    timeout: float = TIMEOUT - Seconds before a request is abandoned
+    session: requests.Session = None - Session to use, defaults to get_session().
+        Its pool_maxsize should be at least concurrency to keep connections alive
+    conditional: bool = False - Send stored validators, see fetch_page()
+    path: str = 'logs/' - Path CACHE and VALIDATORS files are located
+    limiter: HostLimiter = None - Per-host rate limits, see HostLimiter
+    decode: bool = True - Decode pages, see fetch_page()
+
+    Returns:
+    -------------
+    results: list of dict - One result per url (same order as urls), see fetch_page()
+    wall_time: float - Seconds the whole sweep took
+    """
+
+    start = time.perf_counter()
+    results = asyncio.run(
+        sweep_async(
+            urls,
+            concurrency=concurrency,
+            timeout=timeout,
+            session=session,
+            conditional=conditional,
+            path=path,
+            limiter=limiter,
+            decode=decode,
+        )
+    )
+    wall_time = time.perf_counter() - start
+
+    return results, wall_time
+
+
+def sweep_report(results, wall_time, limiter=None):
+    """
+    Summarizes a sweep with its total wall time and the latency of each url
+    (slowest first)
+
+    Parameters:
+    -------------
+    results: list of dict - Results from sweep()
+    wall_time: float - Seconds the whole sweep took
+    limiter: HostLimiter = None - Adds the limiter counters, see HostLimiter.report()
+
+    Returns:
+    -------------
+    report: str - Formatted summary of the sweep
+    """
+
+    latencies = [result["latency"] for result in results]
+    wait_time = sum(result.get("wait_time", 0.0) for result in results)
+    n_failed = sum(1 for result in results if result["error"] is not None)
+    n_not_modified = sum(1 for result in results if result["not_modified"])
+    n_deferred = sum(1 for result in results if result.get("deferred"))
+    total_latency = sum(latencies)
+
+    report = []
+    report.append(
+        f"[{now_hms()}] Swept {len(results)} pages in {wall_time:.2f}s "
+        f"({n_failed} failed, {n_not_modified} not modified, {n_deferred} deferred)"
+    )
+    if wall_time > 0:
+        report.append(
+            f"Sum of request latencies: {total_latency:.2f}s "
+            f"({total_latency / wall_time:.1f}x speedup over serial)"
+        )
+    if limiter is not None:
+        report.append(
+            f"Sum of waits for host limits: {wait_time:.2f}s (not in the latencies)"
+        )
+        report.append(limiter.report())
+
+    for result in sorted(results, key=lambda result: -result["latency"]):
+        status = result["status"] if result["status"] is not None else "FAILED"
+        report.append(f"{result['latency']:8.3f}s  [{status}]  {result['url']}")
+
+    return "\n".join(report)
+
+
+# PARSING STAGE
+
+
+def analyze_page(
+    page, encoding=None, keywords=[], ignorewords=[], backend="stream", digest=None
+):
+    """
+    CPU-bound half of check_page(): normalizes whitespace, digests the page and,
+    if the digest differs from the given one, extracts its anchors,
+    fingerprints them and matches them against the keywords. Only needs its
+    arguments (no files or network), so it can run in a worker process, see
+    ParserPool.
+
+    e.g. analyze_page(b'<body><a href="/covid">Covid</a></body>', keywords=['covid'])
+
+    Parameters:
+    -------------
+    page: bytes or str - Html content of the page, raw bytes are decoded with encoding
+    encoding: str = None - Encoding of raw bytes (undeclared encodings are read as utf-8)
+    keywords: list of str - Keywords that mark an anchor as relevant
+    ignorewords: list of str - Keywords that mark an anchor as not relevant
+    backend: str = 'stream' - Anchor extraction backend, see extract_anchors()
+    digest: str = None - Digest of the cached page, the page is not parsed if it matches
+
+    Returns:
+    -------------
+    analysis: dict - Keys are 'has_body', 'digest' (see page_digest()), 'page'
+        (normalized html, None if unchanged), 'anchors' (list of (href, content)
+        tuples, None if unchanged), 'fingerprints' (of each anchor, see
+        anchor_fingerprint()) and 'relevant' (relevant anchor -> keywords found)
+    """
+
+    if isinstance(page, bytes):
+        page = page.decode(encoding or "utf-8", errors="replace")
+
+    page = " ".join(page.split())
+
+    analysis = {
+        "has_body": get_body(page) is not None,
+        "digest": None,
+        "page": None,
+        "anchors": None,
+        "fingerprints": None,
+        "relevant": {},
+    }
+    if not analysis["has_body"]:
+        return analysis
+
+    # Unchanged pages are not parsed, and not sent back
+    analysis["digest"] = page_digest(page)
+    if analysis["digest"] == digest:
+        return analysis
+
+    anchors = extract_anchors(page, backend=backend)
+    rel_anchors, rel_keywords = relevant_anchors(
+        anchors, keywords=keywords, ignorewords=ignorewords
+    )
+
+    analysis["relevant"] = dict(zip(rel_anchors, rel_keywords))
+    analysis["page"] = page
+    analysis["anchors"] = anchors
+    analysis["fingerprints"] = [anchor_fingerprint(anchor) for anchor in anchors]
+
+    return analysis
+
+
+def _analyze_page(args):
+    return analyze_page(*args)
+
+
+def _ignore_interrupts():
+    # Ctrl+C is handled by the parent, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ParserPool:
+    """
+    Runs analyze_page() for the pages of a sweep in a pool of worker processes,
+    so parsing uses every core instead of queueing on the GIL. Pages go in as
+    raw bytes (see sweep(decode=False)) and only the analyses come back, with
+    the page itself only for pages that changed.
+
+    e.g. with ParserPool() as parser_pool:
+             results, wall_time = sweep(urls, decode=False)
+             analyses = parser_pool.analyze(results, keywords)
+             for url, result, analysis in zip(urls, results, analyses):
+                 if analysis is not None:
+                     check_page(url, None, keywords, analysis=analysis)
+
+    Parameters:
+    -------------
+    processes: int = None - Worker processes, defaults to the number of cores.
+        0 analyzes pages in this process
+    backend: str = 'stream' - Anchor extraction backend, see extract_anchors()
+    chunksize: int = 4 - Pages sent to a worker at a time
+    """
+
+    def __init__(self, processes=None, backend="stream", chunksize=4):
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        self.processes = processes
+        self.backend = backend
+        self.chunksize = chunksize
+        self.executor = None
+        if processes > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=processes, initializer=_ignore_interrupts
+            )
+
+    def analyze(self, results, keywords=[], ignorewords=[], path="logs/"):
+        """
+        Analyzes the pages fetched by a sweep
+
+        Parameters:
+        -------------
+        results: list of dict - Results from sweep()
+        keywords: list of str - Keywords that mark an anchor as relevant
+        ignorewords: list of str - Keywords that mark an anchor as not relevant
+        path: str = 'logs/' - Path the cached digests are located
+
+        Returns:
+        -------------
+        analyses: list of dict - One analysis per result (None for failed and
+            not modified pages), see analyze_page()
+        """
+
+        indices = []
+        jobs = []
+        for i, result in enumerate(results):
+            if result["error"] is not None or result["not_modified"]:
+                continue
+
+            page = result["content"] if result["page"] is None else result["page"]
+            if page is None:
+                continue
+
+            digest = load_digest(result["url"], path=path)
+            indices.append(i)
+            jobs.append(
+                (page, result["encoding"], keywords, ignorewords, self.backend, digest)
+            )
+
+        if self.executor is None:
+            done = map(_analyze_page, jobs)
+        else:
+            done = self.executor.map(_analyze_page, jobs, chunksize=self.chunksize)
+
+        analyses = [None] * len(results)
+        for i, analysis in zip(indices, done):
+            analyses[i] = analysis
+
+        return analyses
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_page(
+    url,
+    page,
+    keywords,
+    ignorewords=[],
+    path="logs/",
+    validators=None,
+    backend="stream",
+    policy=None,
+    analysis=None,
+):
+    """
+    Runs a freshly fetched page through the monitoring pipeline:
+    cache_updated() -> extract_anchors() -> new_anchors() -> relevant_anchors()
+    Pages are only parsed once cache_updated() has detected a change.
+    The cache is updated with the new page if an update was detected, and
+    the validators of the response are stored once the page has been cached.
+    Relevant anchors are added to the page's anchor journal, see store_anchors().
+
+    The parsing is done by analyze_page(), unless the analysis is given (e.g.
+    from a ParserPool), in which case the page itself is not needed.
+
+    Parameters:
+    -------------
+    url: str - Url of the page
+    page: str - Html content of the page, None if analysis is given
+    keywords: list of str - Keywords that mark an anchor as relevant
+    ignorewords: list of str - Keywords that mark an anchor as not relevant
+    path: str = 'logs/' - Path where CACHE, ANCHORS and LOG files are saved
+    validators: dict = None - ETag/Last-Modified of the response, see fetch_page()
+    backend: str = 'stream' - Anchor extraction backend, see extract_anchors()
+    policy: AdaptivePolicy = None - Told whether the page changed, see AdaptivePolicy.observe().
+        Only given for pages whose interval the policy learns
+    analysis: dict = None - analyze_page() of the page against the cached digest
+
+    Returns:
+    -------------
+    rel_anchors: list of (href, content) tuples - New anchors that are relevant
+    rel_keywords: list of list of str - Keywords found in each relevant anchor
+    """
+
+    if analysis is None:
+        analysis = analyze_page(
+            page,
+            keywords=keywords,
+            ignorewords=ignorewords,
+            backend=backend,
+            digest=load_digest(url, path=path),
+        )
+
+    if not analysis["has_body"]:
+        message = f"Cannot find <body></body> for {url}"
+        write_log(message, url, path=path, event="no_body")
+        return [], []
+
+    # Check if page is different from cached page (digest compare, no parsing)
+    page = analysis["page"]
+    has_update = cache_updated(url, page, path=path, digest=analysis["digest"])
+
+    if policy is not None:
+        policy.observe(url, has_update)
+
+    if not has_update:
+        if validators is not None:
+            store_validators(url, validators, path=path)
+        return [], []
+
+    # Look up new anchors in the fingerprint index of the last seen page
+    diff_anchors = new_anchors(
+        url, analysis["anchors"], path=path, fingerprints=analysis["fingerprints"]
+    )
+
+    relevant = analysis["relevant"]
+    rel_anchors = [anchor for anchor in diff_anchors if anchor in relevant]
+    rel_keywords = [relevant[anchor] for anchor in rel_anchors]
+
+    if len(rel_anchors) == 0:
+        message = f"[{now_hms()}] Update detected but no new anchors\n"
+        write_log(message, url, path=path, event="no_new_anchors")
+    else:
+        store_anchors(url, rel_anchors, path=path)
+
+    store_cache(url, page, path=path)
+    if validators is not None:
+        store_validators(url, validators, path=path)
+
+    return rel_anchors, rel_keywords
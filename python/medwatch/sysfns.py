@@ -4,9 +4,15 @@ import os
 import sys
 import time
 import math
+import heapq
+import zlib
+import json
 from datetime import datetime, timedelta
 
 
+_WATCHED = {}  # (filename, loader) -> ((mtime, size), loaded object), see load_watched()
+
+
 # SYSTEM FUNCTIONS
 
 def now_hms():
@@ -31,6 +37,38 @@ def now_hms():
     return current_time
 
 
+def load_watched(filename, loader):
+    """
+    Loads a config file with loader(filename) and caches the result. Later
+    calls only stat the file and return the cached object, unless the file's
+    modification time or size changed, in which case it is loaded again.
+    The cached object is shared between calls so it should not be modified.
+
+    e.g. load_watched('keywords_covid.csv', load_keywords_csv)
+
+    Parameters:
+    -------------
+    filename: str - Path to the file
+    loader: function - Takes filename and returns the loaded object
+
+    Returns:
+    -------------
+    loaded - Object returned by loader
+    """
+
+    stat = os.stat(filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(filename), loader)
+
+    if key in _WATCHED and _WATCHED[key][0] == signature:
+        return _WATCHED[key][1]
+
+    loaded = loader(filename)
+    _WATCHED[key] = (signature, loaded)
+
+    return loaded
+
+
 def is_na(subject):
     """
     Checks if input is NaN which may be in multiple formats including a string
@@ -109,13 +147,13 @@ def gen_next_time(intervals, start_time=[6, 0, 0], end_time=[23, 0, 0]):
     month = now.month
     day = now.day
 
-    starttime, endtime = mw.gen_start_end_times(
+    starttime, endtime = gen_start_end_times(
         start_time=start_time, end_time=end_time
     )
 
-    next_datetime = start_time
+    next_datetime = starttime
 
-    while next_datetime < end_time:
+    while next_datetime < endtime:
 
         if next_datetime < now:
             while next_datetime < now:
@@ -124,3 +162,384 @@ def gen_next_time(intervals, start_time=[6, 0, 0], end_time=[23, 0, 0]):
             next_datetime += timedelta(seconds=intervals)
 
         yield next_datetime
+
+
+# SCHEDULING
+
+
+def next_in_window(when, start_time=[6, 0, 0], end_time=[23, 0, 0]):
+    """
+    Moves a datetime forward into the daily window between start_time and
+    end_time (local time), leaving it as it is if it is already inside
+
+    e.g. next_in_window(datetime(2020, 7, 1, 23, 30))
+         returns datetime(2020, 7, 2, 6, 0)
+
+    Parameters:
+    -------------
+    when: datetime - Time to move
+    start_time: list of length 3 = [6, 0, 0] - [H, M, S] the window opens
+    end_time: list of length 3 = [23, 0, 0] - [H, M, S] the window closes
+
+    Returns:
+    -------------
+    when: datetime - First time at or after when that is inside the window
+    """
+
+    day_start = when.replace(
+        hour=start_time[0], minute=start_time[1], second=start_time[2], microsecond=0
+    )
+    day_end = when.replace(
+        hour=end_time[0], minute=end_time[1], second=end_time[2], microsecond=0
+    )
+
+    if when < day_start:
+        return day_start
+    if when >= day_end:
+        return day_start + timedelta(days=1)
+
+    return when
+
+
+class Scheduler:
+    """
+    Decides when each url is next checked. Every url has its own polling
+    interval and daily window, and urls are handed out as they come due
+    rather than all at once. Urls are first due at a point within their
+    first interval that depends on the url, so a list of urls added together
+    is spread out instead of checked in one burst.
+
+    e.g. scheduler = Scheduler(default_interval=120)
+         scheduler.add('https://www.fda.gov/...', interval=60)
+         scheduler.add('https://www.smallbiotech.com/news', interval=900)
+         while True:
+             urls = scheduler.wait()      # sleeps until some urls are due
+             results, wall_time = sweep(urls)
+
+    Parameters:
+    -------------
+    default_interval: float = 120 - Seconds between checks of a url
+    start_time: list of length 3 = [6, 0, 0] - [H, M, S] urls start being checked each day
+    end_time: list of length 3 = [23, 0, 0] - [H, M, S] urls stop being checked each day
+    """
+
+    def __init__(self, default_interval=120, start_time=[6, 0, 0], end_time=[23, 0, 0]):
+        self.default_interval = default_interval
+        self.start_time = start_time
+        self.end_time = end_time
+
+        self.heap = []  # (next_due, seq, url), entries of removed/rescheduled urls are skipped
+        self.sites = {}  # url -> {'interval', 'start_time', 'end_time', 'due', 'seq'}
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __contains__(self, url):
+        return url in self.sites
+
+    def _push(self, url, due):
+        site = self.sites[url]
+        due = next_in_window(due, site["start_time"], site["end_time"])
+
+        self.seq += 1
+        site["due"] = due
+        site["seq"] = self.seq
+        heapq.heappush(self.heap, (due, self.seq, url))
+
+    def add(self, url, interval=None, start_time=None, end_time=None, due=None):
+        """
+        Adds a url, or changes the settings of a url already added
+
+        Parameters:
+        -------------
+        url: str - Url to check
+        interval: float = None - Seconds between checks (default_interval if None)
+        start_time: list of length 3 = None - Daily window of the url (the
+        end_time: list of length 3 = None -   scheduler's if None)
+        due: datetime = None - When it is first due (spread over the first
+            interval if None)
+
+        Returns:
+        -------------
+        n/a
+        """
+
+        if interval is None:
+            interval = self.default_interval
+
+        self.sites[url] = {
+            "interval": interval,
+            "start_time": self.start_time if start_time is None else start_time,
+            "end_time": self.end_time if end_time is None else end_time,
+        }
+
+        if due is None:
+            offset = interval * zlib.crc32(url.encode("utf-8")) / 2 ** 32
+            due = datetime.now() + timedelta(seconds=offset)
+
+        self._push(url, due)
+
+    def remove(self, url):
+        """Stops checking a url"""
+
+        self.sites.pop(url, None)
+
+    def sync(self, urls, intervals={}):
+        """
+        Makes the urls scheduled match urls: new ones are added, missing ones
+        removed and the intervals given updated
+
+        Parameters:
+        -------------
+        urls: iterable of str - Urls to check
+        intervals: dict = {} - Interval of urls not checked every default_interval
+        """
+
+        urls = set(urls)
+
+        for url in list(self.sites):
+            if url not in urls:
+                self.remove(url)
+
+        for url in urls:
+            if url not in self.sites:
+                self.add(url, interval=intervals.get(url, self.default_interval))
+            elif url in intervals:
+                self.set_interval(url, intervals[url])
+
+    def interval(self, url):
+        """Seconds between checks of a url"""
+
+        return self.sites[url]["interval"]
+
+    def set_interval(self, url, interval):
+        """
+        Changes how often a url is checked and reschedules it to one interval
+        after it was last checked (after now if it has not been checked yet)
+        """
+
+        site = self.sites[url]
+        if interval == site["interval"]:
+            return
+
+        site["interval"] = interval
+        self._push(url, site.get("checked", datetime.now()) + timedelta(seconds=interval))
+
+    def next_due(self):
+        """
+        When the next url is due
+
+        Returns:
+        -------------
+        next_due: datetime - None if no urls are scheduled
+        """
+
+        while self.heap:
+            due, seq, url = self.heap[0]
+            if url in self.sites and self.sites[url]["seq"] == seq:
+                return due
+            heapq.heappop(self.heap)
+
+        return None
+
+    def pop_due(self, now=None):
+        """
+        Takes the urls due by now and schedules their next check one interval
+        from now (or when their window next opens)
+
+        Parameters:
+        -------------
+        now: datetime = None - Time to compare against (datetime.now() if None)
+
+        Returns:
+        -------------
+        urls: list of str - Urls due, earliest first
+        """
+
+        if now is None:
+            now = datetime.now()
+
+        urls = []
+        while self.heap and self.heap[0][0] <= now:
+            due, seq, url = heapq.heappop(self.heap)
+            if url not in self.sites or self.sites[url]["seq"] != seq:
+                continue
+
+            urls.append(url)
+
+        for url in urls:
+            self.sites[url]["checked"] = now
+            self._push(url, now + timedelta(seconds=self.sites[url]["interval"]))
+
+        return urls
+
+    def wait(self, slack=1):
+        """
+        Sleeps until the next url is due and takes the urls due by then
+
+        Parameters:
+        -------------
+        slack: float = 1 - Urls due within this many seconds after are taken too
+
+        Returns:
+        -------------
+        urls: list of str - Urls due, see pop_due()
+        """
+
+        next_due = self.next_due()
+        if next_due is None:
+            return []
+
+        seconds = (next_due - datetime.now()).total_seconds()
+        if seconds > 0:
+            time.sleep(seconds)
+
+        return self.pop_due(datetime.now() + timedelta(seconds=slack))
+
+
+class AdaptivePolicy:
+    """
+    Learns how often each page changes and sets its polling interval to
+    match. Every check of a page is reported to observe(): the interval of a
+    page that changed is multiplied by tighten (down to min_interval) and
+    that of a page that did not by backoff (up to max_interval). Changes are
+    also counted by hour of the day, so a page is checked more often at the
+    hours it usually changes and less often at the hours it never does.
+
+    e.g. policy = AdaptivePolicy(filename='logs/POLICY.json')
+         changed = cache_updated(url, page)
+         scheduler.set_interval(url, policy.observe(url, changed))
+         policy.save()
+
+    Parameters:
+    -------------
+    base_interval: float = 120 - Interval of a page not seen before (seconds)
+    min_interval: float = 60 - Shortest interval
+    max_interval: float = 3600 - Longest interval
+    backoff: float = 1.25 - Interval multiplier after a check finding no change
+    tighten: float = 0.5 - Interval multiplier after a check finding a change
+    decay: float = 0.95 - Weight kept by the hour-of-day counts on every change
+    filename: str = None - JSON file the history is kept in (not kept if None)
+    """
+
+    def __init__(
+        self,
+        base_interval=120,
+        min_interval=60,
+        max_interval=3600,
+        backoff=1.25,
+        tighten=0.5,
+        decay=0.95,
+        filename=None,
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.tighten = tighten
+        self.decay = decay
+        self.filename = filename
+
+        # url -> {'interval', 'checks', 'changes', 'last_change', 'hours'}
+        self.pages = {}
+        if filename is not None and os.path.isfile(filename):
+            with open(filename, "r") as f:
+                self.pages = json.load(f)
+
+    def page(self, url):
+        if url not in self.pages:
+            self.pages[url] = {
+                "interval": self.base_interval,
+                "checks": 0,
+                "changes": 0,
+                "last_change": None,
+                "hours": [0] * 24,
+            }
+
+        return self.pages[url]
+
+    def observe(self, url, changed, when=None):
+        """
+        Records a check of a page and returns its new interval
+
+        Parameters:
+        -------------
+        url: str - Url of the page
+        changed: bool - Whether the check found the page changed
+        when: datetime = None - When the page was checked (now if None)
+
+        Returns:
+        -------------
+        interval: float - Seconds until the page should be checked again, see interval()
+        """
+
+        if when is None:
+            when = datetime.now()
+
+        page = self.page(url)
+        page["checks"] += 1
+
+        if changed:
+            page["changes"] += 1
+            page["last_change"] = when.isoformat(timespec="seconds")
+            page["hours"] = [count * self.decay for count in page["hours"]]
+            page["hours"][when.hour] += 1
+            page["interval"] *= self.tighten
+        else:
+            page["interval"] *= self.backoff
+
+        page["interval"] = min(max(page["interval"], self.min_interval), self.max_interval)
+
+        return self.interval(url, when)
+
+    def interval(self, url, when=None):
+        """
+        Seconds between checks of a page at a given time of day: its learned
+        interval, shortened at hours it has often changed at and lengthened at
+        hours it has not
+
+        Parameters:
+        -------------
+        url: str - Url of the page
+        when: datetime = None - Time of day (now if None)
+
+        Returns:
+        -------------
+        interval: float - Seconds between checks
+        """
+
+        if when is None:
+            when = datetime.now()
+
+        # Pages not seen before are not added to the history until observed
+        page = self.pages.get(url) or {
+            "interval": self.base_interval,
+            "hours": [0] * 24,
+        }
+        hours = page["hours"]
+
+        # Relative activity of this hour, 1 if the page has no history
+        activity = (hours[when.hour] + 1) / (sum(hours) / 24 + 1)
+        interval = page["interval"] / activity
+
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def forget(self, url):
+        """
+        Drops the history of a page, e.g. one given a fixed interval
+        """
+
+        self.pages.pop(url, None)
+
+    def save(self):
+        """
+        Writes the history of every page to filename
+        """
+
+        if self.filename is None:
+            return
+
+        with open(f"{self.filename}.tmp", "w") as f:
+            json.dump(self.pages, f)
+        os.replace(f"{self.filename}.tmp", self.filename)
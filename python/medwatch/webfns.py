@@ -1,25 +1,186 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
 import requests
 import json
 import yaml
 import csv
 import hashlib
-import smtplib
-import ssl
 import pickle
 import pytz
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from html import unescape
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+from requests.adapters import HTTPAdapter
 from tzlocal import get_localzone
+from urllib.parse import urljoin
+from urllib3.util.retry import Retry
 
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional, see lxml_anchors()
+    etree = None
+
+from .keywords import compile_keywords
+from .limiter import THROTTLE_STATUSES
+from .notify import EmailDispatcher
+from .snapshots import get_snapshot_store
+from .state import active_store
+from .sysfns import load_watched, now_hms
+
+# Sent with every request made through the shared session
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36"
+}
+
+TIMEOUT = 30  # Default seconds to wait on connecting/reading before giving up
+
+_SESSION = None  # Shared session, see get_session()
+
+_LINK_CACHES = {}  # Link caches by filename, see get_link_cache()
+
+_LOG_WRITER = None  # Active LogWriter, see write_log()
+
+
+# HTTP CLIENT
+
+
+def create_session(
+    pool_connections=50,
+    pool_maxsize=20,
+    retries=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    headers=HEADERS,
+    retry_throttled=True,
+):
+    """
+    Creates a requests Session that keeps connections alive and pools them
+    per host, and retries failed GET/HEAD requests with exponential backoff
+    (honouring Retry-After). Requests made with a HostLimiter should not retry
+    429/503 responses (retry_throttled=False): the retries would wait out
+    Retry-After inside the request, with no bound, before the limiter sees
+    the host is throttling.
+
+    Parameters:
+    -------------
+    pool_connections: int = 50 - Number of hosts to keep connection pools for
+    pool_maxsize: int = 20 - Maximum number of connections kept per host
+    retries: int = 3 - Number of retries before giving up on a request
+    backoff_factor: float = 0.5 - Retries wait backoff_factor * 2^(retry - 1) seconds
+    status_forcelist: tuple of int - Status codes that trigger a retry
+    headers: dict - Headers sent with every request
+    retry_throttled: bool = True - Retry 429/503 responses, see HostLimiter
+
+    Returns:
+    -------------
+    session: requests.Session - Configured session
+    """
+
+    # urllib3 retries any response with a Retry-After header when it is honoured
+    if not retry_throttled:
+        status_forcelist = [s for s in status_forcelist if s not in THROTTLE_STATUSES]
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=frozenset(["HEAD", "GET"]),
+        respect_retry_after_header=retry_throttled,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_session():
+    """
+    Returns the session shared by all medwatch network calls, creating it
+    with the defaults of create_session() on first use
+
+    Returns:
+    -------------
+    session: requests.Session - Shared session
+    """
+
+    global _SESSION
+
+    if _SESSION is None:
+        _SESSION = create_session()
+
+    return _SESSION
+
+
+def configure_session(**kwargs):
+    """
+    Replaces the shared session with one created with the given settings
+    e.g. configure_session(pool_maxsize=100, retries=5)
+         configure_session(retry_throttled=False)  # Sweeps use a HostLimiter
+
+    Parameters:
+    -------------
+    **kwargs - Passed to create_session()
+
+    Returns:
+    -------------
+    session: requests.Session - New shared session
+    """
+
+    global _SESSION
+
+    if _SESSION is not None:
+        _SESSION.close()
+
+    _SESSION = create_session(**kwargs)
+
+    return _SESSION
 
 # MONITORING WEBPAGES
 
 
+def prune_url(full_url: str, cut_chars=[]):
+    """
+    Method to clean up domain (e.g. removes www. or http://)
+    Found having full URL can yield odd Google searches
+    e.g. prune_url('https://www.google.com/', cut_chars=['https://', 'www.'])
+         returns 'google.com'
+    Parameters:
+    -------------
+    full_url: str - String of URL to be pruned
+    Returns:
+    -------------
+    pruned_url: str - String of pruned URL
+    """
+
+    # cut_chars = ["https://", "http://", "www."]
+
+    for cut in cut_chars:
+        full_url = full_url.replace(cut, "")
+
+    if full_url[-1] == "/":
+        pruned_url = full_url[0:-1]
+    else:
+        pruned_url = full_url
+
+    return pruned_url
+
+
 def url_to_filename(base_url: str):
     """
     Takes URL and replaces all unallowed Unix and Windows filename characters
@@ -54,25 +215,45 @@ def url_to_filename(base_url: str):
 
 def load_cache(base_url, path="logs/"):
     """
-    Finds CACHE html file associated with url and returns the html content as
-    as a string
+    Finds the latest snapshot of a url (see store_cache()) and returns the
+    html content as a string
 
     Parameters:
     -------------
     base_url: str - Url of cached site
-    path: str = 'logs/' - Path CACHE files are located
+    path: str = 'logs/' - Path snapshots (or older CACHE files) are located
 
     Returns:
     -------------
     data_cach: str - Formatted html contents
+
+    Raises FileNotFoundError if the page has no snapshot (or its object is
+    missing) and no CACHE file.
     """
 
+    store = active_store(path)
+    if store is not None:
+        data_cache = store.load_cache(base_url)
+        if data_cache is None:
+            raise FileNotFoundError(f"No cached page for {base_url}")
+        return " ".join(data_cache.split())
+
     # Convert URL to filename and read contents
     url_filename = url_to_filename(base_url)
-
-    filename = f"{path}CACHE-{url_filename}.html"
-    f = open(filename, "r")
-    data_cache = f.read()
+    snapshots = get_snapshot_store(path)
+    latest = snapshots.latest(url_filename)
+
+    data_cache = None
+    if latest is not None:
+        data_cache = snapshots.get(latest["object"])
+
+    # Caches stored before snapshots were kept
+    if data_cache is None:
+        filename = f"{path}CACHE-{url_filename}.html"
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f"No cached page for {base_url} in {path}")
+        f = open(filename, "r")
+        data_cache = f.read()
 
     data_cache = " ".join(data_cache.split())  # Remove all whitespaces
 
@@ -81,35 +262,184 @@ def load_cache(base_url, path="logs/"):
 
 def store_cache(base_url, data, path="logs/"):
     """
-    [Over]write stored snapshot/cache of a webpage's html contents
+    Stores a snapshot of a webpage's html contents as its latest version.
+    Snapshots are compressed and kept for a few weeks, and identical snapshots
+    are only saved once, see SnapshotStore.
 
     Parameters:
     -------------
     base_url: str - Url of site to be cached
     data: str - Html content of the site
-    path: str - 'logs/' - Path where CACHE to be saved
+    path: str - 'logs/' - Path where snapshots to be saved
 
     Returns:
     -------------
     n/a
     """
 
-    # Convert URL to filename and write html content into that file
+    store = active_store(path)
+    if store is not None:
+        store.store_cache(base_url, data, page_digest(data))
+        return
+
     url_filename = url_to_filename(base_url)
-    filename = f"{path}CACHE-{url_filename}.html"
-    f = open(filename, "w+")
-    f.write(data)
-    f.close()
+    get_snapshot_store(path).put(url_filename, data, page_digest(data))
+
+    # The snapshot replaces the CACHE and DIGEST files of older versions
+    for filename in (f"{path}CACHE-{url_filename}.html", f"{path}DIGEST-{url_filename}.txt"):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def cache_exists(base_url, path="logs/"):
+    """
+    Checks if a page has been cached
+
+    Parameters:
+    -------------
+    base_url: str - Url of site
+    path: str = 'logs/' - Path CACHE files are located
+
+    Returns:
+    -------------
+    True or False - True if a cache of the page is stored
+    """
+
+    store = active_store(path)
+    if store is not None:
+        return store.has_cache(base_url)
+
+    url_filename = url_to_filename(base_url)
+    if get_snapshot_store(path).latest(url_filename) is not None:
+        return True
+
+    return os.path.isfile(f"{path}CACHE-{url_filename}.html")
+
+
+def get_body(data):
+    """
+    Finds the <body></body> of an html string without parsing the html
+
+    Parameters:
+    -------------
+    data: str - Html content of a webpage
+
+    Returns:
+    -------------
+    body: str - Html from <body> to </body> (or to the end of the page if never
+        closed), None if the page has no <body>
+    """
+
+    data_lower = data.lower()
+
+    start = data_lower.find("<body")
+    if start == -1:
+        return None
+
+    end = data_lower.rfind("</body>")
+    if end < start:
+        return data[start:]
+
+    return data[start : end + len("</body>")]
+
+
+def page_digest(data):
+    """
+    SHA-256 digest of a page's <body> with whitespace normalized, so that two
+    versions of a page can be compared without parsing either. The whole page
+    is hashed if there is no <body>.
+
+    Parameters:
+    -------------
+    data: str - Html content of a webpage
+
+    Returns:
+    -------------
+    digest: str - Hex digest
+    """
+
+    body = get_body(data)
+    if body is None:
+        body = data
+
+    body = " ".join(body.split())
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    return digest
+
+
+def load_digest(base_url, path="logs/"):
+    """
+    Loads the digest of the cached page of a url, see page_digest()
+
+    Parameters:
+    -------------
+    base_url: str - Url of cached site
+    path: str = 'logs/' - Path snapshots (or older DIGEST files) are located
+
+    Returns:
+    -------------
+    digest: str - Hex digest, None if no digest stored
+    """
+
+    store = active_store(path)
+    if store is not None:
+        return store.load_digest(base_url)
+
+    url_filename = url_to_filename(base_url)
+    latest = get_snapshot_store(path).latest(url_filename)
+    if latest is not None:
+        return latest["digest"]
+
+    filename = f"{path}DIGEST-{url_filename}.txt"
+
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, "r") as f:
+        digest = f.read().strip()
+
+    return digest
+
+
+def store_digest(base_url, digest, path="logs/"):
+    """
+    [Over]write the digest of the cached page of a url
+
+    Parameters:
+    -------------
+    base_url: str - Url of cached site
+    digest: str - Hex digest, see page_digest()
+    path: str = 'logs/' - Path where DIGEST to be saved
+
+    Returns:
+    -------------
+    n/a
+    """
+
+    store = active_store(path)
+    if store is not None:
+        store.store_digest(base_url, digest)
+        return
+
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}DIGEST-{url_filename}.txt"
+
+    with open(filename, "w") as f:
+        f.write(digest)
 
 
 def store_anchors(base_url, anchors, path="logs/"):
     """
-    Append to a list of relevant anchors for a given URL
+    Appends a batch of relevant anchors to the anchor journal of a given URL.
+    The journal is a JSON-lines file, one record per batch, so storing anchors
+    does not read or rewrite the anchors stored before. Anchors stored by older
+    versions (a pickled list in ANCHORS-*.txt) are migrated first.
 
     Parameters:
     -------------
     base_url: str - Url of site to be cached
-    data: str - new anchors to add
+    anchors: list of bs4 anchors or (href, content) tuples - new anchors to add
     path: str - 'logs/' - Path where ANCHORS to be saved
 
     Returns:
@@ -117,266 +447,1134 @@ def store_anchors(base_url, anchors, path="logs/"):
     n/a
     """
 
+    store = active_store(path)
+    if store is not None:
+        store.store_anchors(base_url, [parse_anchor(anchor) for anchor in anchors])
+        return
+
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}ANCHORS-{url_filename}.jsonl"
+
+    if os.path.isfile(f"{path}ANCHORS-{url_filename}.txt"):
+        migrate_anchors_file(f"{path}ANCHORS-{url_filename}.txt")
+
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "anchors": [list(parse_anchor(anchor)) for anchor in anchors],
+    }
+
+    with open(filename, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_anchors(base_url, path="logs/"):
+    """
+    Reads the anchor journal of a given URL one batch at a time, oldest first,
+    without loading the whole history
+
+    e.g. for record in read_anchors(url):
+             print(record['time'], record['anchors'])
+
+    Parameters:
+    -------------
+    base_url: str - Url of site
+    path: str - 'logs/' - Path where ANCHORS are saved
+
+    Returns:
+    -------------
+    records: generator of dict - Keys are 'time' (ISO format, None if
+        unknown) and 'anchors' (list of (href, content) tuples)
+    """
+
+    store = active_store(path)
+    if store is not None:
+        yield from store.read_anchors(base_url)
+        return
+
     url_filename = url_to_filename(base_url)
-    filename = f"{path}ANCHORS-{url_filename}.txt"
+    filename = f"{path}ANCHORS-{url_filename}.jsonl"
+
+    if os.path.isfile(f"{path}ANCHORS-{url_filename}.txt"):
+        migrate_anchors_file(f"{path}ANCHORS-{url_filename}.txt")
+
+    if not os.path.isfile(filename):
+        return
+
+    with open(filename, "r") as f:
+        for line in f:
+            # Skip a line cut short by a crash mid-append
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            record["anchors"] = [tuple(anchor) for anchor in record["anchors"]]
+            yield record
+
+
+def migrate_anchors_file(filename):
+    """
+    Converts a pickled ANCHORS-*.txt file into the JSON-lines journal read
+    by read_anchors(). Anchors already in the journal are kept after the
+    migrated ones, and the pickle file is removed once migrated.
+
+    The pickle holds the first batch of anchors followed by one list per
+    later batch. Migrated batches have no time.
+
+    Parameters:
+    -------------
+    filename: str - [path and] filename of the ANCHORS-*.txt file
+
+    Returns:
+    -------------
+    migrated: bool - True if the file was migrated
+    """
+
+    journal_filename = f"{filename[:-len('.txt')]}.jsonl"
 
-    if os.path.isfile(filename):
+    try:
         with open(filename, "rb") as fp:
             all_anchors = pickle.load(fp)
-        all_anchors.append(anchors)
-    else:
-        all_anchors = anchors
+    except Exception as e:
+        print(f"Cannot migrate {filename}: {e}")
+        return False
 
-    with open(filename, "wb") as fp:
-        pickle.dump(all_anchors, fp)
+    first_batch = [anchor for anchor in all_anchors if not isinstance(anchor, list)]
+    batches = [first_batch] if first_batch else []
+    batches.extend(anchor for anchor in all_anchors if isinstance(anchor, list))
 
+    tmp_filename = f"{journal_filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        for batch in batches:
+            record = {"time": None, "anchors": [list(parse_anchor(anchor)) for anchor in batch]}
+            f.write(json.dumps(record) + "\n")
 
-def datetime_header_format(_datetime):
+        if os.path.isfile(journal_filename):
+            with open(journal_filename, "r") as journal:
+                f.writelines(journal)
+
+    os.replace(tmp_filename, journal_filename)
+    os.remove(filename)
+
+    return True
+
+
+def migrate_anchors(path="logs/"):
     """
-    Takes a datetime object and converts it to string format that
-    can be interpretted by request headers
+    Converts every pickled ANCHORS-*.txt file in path, see migrate_anchors_file()
 
     Parameters:
     -------------
-    _datetime: datetime object - given in any timezone
+    path: str - 'logs/' - Path where ANCHORS are saved
 
     Returns:
     -------------
-    _datetime: str - formatted string in GMT
+    n_migrated: int - Number of files migrated
     """
 
-    _datetime = _datetime.astimezone(pytz.timezone('GMT'))
-    _datetime = _datetime.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    return _datetime
-    
+    n_migrated = 0
 
-def localize_tz(_datetime):
+    for filename in sorted(os.listdir(path)):
+        if filename.startswith("ANCHORS-") and filename.endswith(".txt"):
+            n_migrated += migrate_anchors_file(os.path.join(path, filename))
+
+    return n_migrated
+
+
+def load_validators(base_url, path="logs/"):
     """
-    Takes a datetime object and converts it to the local timezone
+    Loads the validators (ETag and Last-Modified) last returned by a url
 
     Parameters:
     -------------
-    _datetime: datetime object - given in any timezone
+    base_url: str - Url of cached site
+    path: str = 'logs/' - Path VALIDATORS files are located
+
+    Returns:
+    -------------
+    validators: dict - Keys 'etag' and/or 'last_modified' (empty if none stored)
+    """
+
+    store = active_store(path)
+    if store is not None:
+        return store.load_validators(base_url)
+
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}VALIDATORS-{url_filename}.json"
+
+    if not os.path.isfile(filename):
+        return {}
+
+    with open(filename, "r") as f:
+        validators = json.load(f)
+
+    return validators
+
+
+def store_validators(base_url, validators, path="logs/"):
+    """
+    [Over]write the validators (ETag and Last-Modified) stored for a url.
+    Nothing is stored if there are no validators.
+
+    Parameters:
+    -------------
+    base_url: str - Url of site
+    validators: dict - Keys 'etag' and/or 'last_modified', see response_validators()
+    path: str = 'logs/' - Path where VALIDATORS to be saved
+
+    Returns:
+    -------------
+    n/a
+    """
+
+    store = active_store(path)
+    if store is not None:
+        store.store_validators(base_url, validators)
+        return
+
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}VALIDATORS-{url_filename}.json"
+
+    if not validators:
+        if os.path.isfile(filename):
+            os.remove(filename)
+        return
+
+    with open(filename, "w") as f:
+        json.dump(validators, f)
+
+
+def response_validators(response):
+    """
+    Pulls the validators (ETag and Last-Modified) out of a response
+
+    Parameters:
+    -------------
+    response: requests.Response - Response of a GET/HEAD request
+
+    Returns:
+    -------------
+    validators: dict - Keys 'etag' and/or 'last_modified' if given by the server
+    """
+
+    validators = {}
+
+    if response.headers.get("ETag"):
+        validators["etag"] = response.headers["ETag"]
+
+    if response.headers.get("Last-Modified"):
+        validators["last_modified"] = response.headers["Last-Modified"]
+
+    return validators
+
+
+def conditional_headers(base_url, path="logs/"):
+    """
+    Builds If-None-Match/If-Modified-Since headers from the stored validators
+    of a url so that the server can reply 304 Not Modified instead of
+    resending an unchanged page. No headers are given if the page has no
+    CACHE, since a 304 would leave nothing to compare against.
+
+    Parameters:
+    -------------
+    base_url: str - Url of site
+    path: str = 'logs/' - Path CACHE and VALIDATORS files are located
+
+    Returns:
+    -------------
+    headers: dict - Conditional request headers (may be empty)
+    """
+
+    if not cache_exists(base_url, path=path):
+        return {}
+
+    validators = load_validators(base_url, path=path)
+
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    return headers
+
+
+def datetime_header_format(_datetime):
+    """
+    Takes a datetime object and converts it to string format that
+    can be interpretted by request headers
+
+    Parameters:
+    -------------
+    _datetime: datetime object - given in any timezone
+
+    Returns:
+    -------------
+    _datetime: str - formatted string in GMT
+    """
+
+    _datetime = _datetime.astimezone(pytz.timezone('GMT'))
+    _datetime = _datetime.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return _datetime
+    
+
+def localize_tz(_datetime):
+    """
+    Takes a datetime object and converts it to the local timezone
+
+    Parameters:
+    -------------
+    _datetime: datetime object - given in any timezone
+
+    Returns:
+    -------------
+    _datetime: datetime object - given in local timezone
+
+    """
+
+    local_tz = str(get_localzone())
+    _datetime = _datetime.astimezone(pytz.timezone(local_tz))
+    
+    return _datetime
+
+
+def url_updated(url, since_datetime, session=None):
+    """
+    Checks if a url has been updated since a certain datetime using the
+    If-Modified-Since header
+
+    Parameters:
+    -------------
+    url: str - url being monitored
+    since_datetime: datetime object - check if changes have been made since this
+        datetime (must be in UTC/GMT)
+    session: requests.Session = None - Session to use, defaults to get_session()
+
+    Returns:
+    -------------
+    True or False - True if changes found, otherwise False
+    """
+
+    if session is None:
+        session = get_session()
+
+    since_datetime = datetime_header_format(since_datetime)
+    headers = {"If-Modified-Since": since_datetime}
+    r = session.head(url, headers=headers, timeout=TIMEOUT)
+
+    status_code = r.status_code
+
+    if status_code == 200:
+        return True
+    elif status_code in [204, 304]:
+        return False
+    else:
+        print(f"Update not detected with status code {status_code}")
+        return False
+
+
+def cache_updated(base_url, data, path="logs/", digest=None):
+    """
+    Checks if new html data is different from old cached html data. If changes
+    found, return True, otherwise return False. If cache not found, it creates 
+    a cache of the html page and returns False.
+
+    Parameters:
+    -------------
+    base_url: str - Url of site to be cached
+    data: str - Html content of the site
+    path: str = 'logs/' - Path where CACHE to be saved
+    digest: str = None - page_digest() of data if already computed, see analyze_page()
+
+    Returns:
+    -------------
+    True or False - True if changes found, otherwise False (including if no 
+        cache found)
+
+    Only the digest of the new page's <body> is computed (see page_digest()),
+    the cached page is not read or parsed.
+    """
+
+    # The stored digest is all that is read for pages cached with one
+    digest_cache = load_digest(base_url, path=path)
+
+    # Caches stored before digests were kept are hashed once
+    if digest_cache is None and cache_exists(base_url, path=path):
+        digest_cache = page_digest(load_cache(base_url, path=path))
+        store_digest(base_url, digest_cache, path=path)
+
+    # Yes: Compare digest of new html data to digest of cached html data
+    if digest_cache is not None:
+        if digest is None:
+            digest = page_digest(data)
+
+        # If cached and new data match, no updates detected, otherwise yes
+        if digest == digest_cache:
+            message = f"[{now_hms()}] No update from {base_url} \n"
+            write_log(message, base_url, path=path, event="no_update")
+            return False
+        else:
+            message = f"[{now_hms()}] Update detected from {base_url} \n"
+            write_log(message, base_url, path=path, event="update")
+            return True
+
+    # No: Create cache of html data
+    else:
+        message1 = f"[{now_hms()}] No cached webpage found for {base_url} \n"
+        message2 = f"[{now_hms()}] Initializing page cache in {path} \n"
+        write_log(f"{message1}{message2}", base_url, path=path, event="cache_created")
+        store_cache(base_url, data, path=path)
+        return False
+
+
+def write_log(message: str, base_url, path="logs/", event="message", anchors=None):
+    """
+    Writes to a log txt file of any message you would like to record.
+    While a LogWriter is active the message is buffered as a JSON record
+    instead, see LogWriter, and while a StateStore is active for path it is
+    stored as an event.
+
+    Parameters:
+    -------------
+    message: str - Message to be written to log
+    base_url: str - Url of site to be cached
+    path: str = 'logs/' - Path where LOG to be saved
+    event: str = 'message' - Kind of message (only recorded by a LogWriter)
+    anchors: list = None - Anchors the message is about (only recorded by a LogWriter)
+
+    Returns:
+    -------------
+    n/a
+    """
+
+    store = active_store(path)
+    if store is not None:
+        if anchors is not None:
+            anchors = [list(parse_anchor(anchor)) for anchor in anchors]
+        store.write_event(base_url, message, event=event, anchors=anchors)
+        return
+
+    if _LOG_WRITER is not None:
+        _LOG_WRITER.write(message, base_url, path=path, event=event, anchors=anchors)
+        return
+
+    print(message)
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}LOG-{url_filename}.txt"
+
+    if os.path.exists(filename):
+        append_write = "a"
+    else:
+        append_write = "w"
+
+    f = open(filename, append_write)
+    f.write(message)
+    f.close()
+
+
+class LogWriter:
+    """
+    Buffers log messages as JSON records and appends them to a single
+    LOG.jsonl file per log path, instead of opening the LOG file of a url for
+    every message. Records are written on flush(), when the buffer is full and
+    when the writer is closed. Used as a context manager, write_log() sends
+    its messages to the writer until the block ends.
+
+    e.g. with LogWriter(echo=False):
+             check_page(url, page, keywords)   # write_log() calls are buffered
+
+    Each line of LOG.jsonl is a record with keys 'time', 'url', 'event',
+    'message' and 'anchors' (if any).
+
+    Parameters:
+    -------------
+    echo: bool = True - Also print each message
+    max_records: int = 1000 - Records buffered before they are written
+    """
+
+    def __init__(self, echo=True, max_records=1000):
+        self.echo = echo
+        self.max_records = max_records
+        self.buffers = {}  # path -> list of json lines
+        self.n_records = 0
+        self.lock = threading.Lock()
+        self.previous = None
+
+    def write(self, message, base_url, path="logs/", event="message", anchors=None):
+        """
+        Buffers a message, see write_log()
+        """
+
+        if self.echo:
+            print(message)
+
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "url": base_url,
+            "event": event,
+            "message": message.strip(),
+        }
+        if anchors is not None:
+            record["anchors"] = [list(parse_anchor(anchor)) for anchor in anchors]
+
+        with self.lock:
+            self.buffers.setdefault(path, []).append(json.dumps(record))
+            self.n_records += 1
+            full = self.n_records >= self.max_records
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered records to the LOG.jsonl file of their path
+        """
+
+        with self.lock:
+            buffers = self.buffers
+            self.buffers = {}
+            self.n_records = 0
+
+        for path, lines in buffers.items():
+            with open(f"{path}LOG.jsonl", "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def __enter__(self):
+        global _LOG_WRITER
+
+        self.previous = _LOG_WRITER
+        _LOG_WRITER = self
+
+        return self
+
+    def __exit__(self, *exc_info):
+        global _LOG_WRITER
+
+        _LOG_WRITER = self.previous
+        self.flush()
+
+
+def read_log(path="logs/", base_url=None):
+    """
+    Reads the records of a LOG.jsonl file one at a time, see LogWriter
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Path where LOG.jsonl is saved
+    base_url: str = None - Only read the records of this url
+
+    Returns:
+    -------------
+    records: generator of dict - Records in the order they were written
+    """
+
+    filename = f"{path}LOG.jsonl"
+    if not os.path.isfile(filename):
+        return
+
+    with open(filename, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if base_url is None or record["url"] == base_url:
+                yield record
+
+
+def get_anchors(html_data):
+    """
+    Takes BeautifulSoup object and searches <body> for anchors
+
+    Parameters:
+    -------------
+    html_data: bs4 - Html content of webpage
+
+    Returns:
+    -------------
+    anchors: list of bs4 - List of all anchors (including tags)
+    """
+
+    # If html_data does not have a <body>, assume the data passed if the <body>
+    if html_data.find("body") == None:
+        html_body = html_data
+    else:
+        html_body = html_data.find("body")
+
+    anchors = list(html_body.find_all("a"))
+
+    return anchors
+
+
+def parse_anchors(anchors):
+    """
+    Takes list of anchors and returns the hrefs and content of each
+
+    Parameters:
+    -------------
+    anchors: list of bs4 or (href, content) tuples - All anchors to be parsed
+
+    Returns:
+    -------------
+    hrefs: list of str - All href content found in each anchor
+    contents: list of str - All content/title found in each anchor
+    """
+    hrefs = []
+    content = []
+
+    for anchor in anchors:
+        if isinstance(anchor, tuple):
+            hrefs.append(anchor[0])
+            content.append(anchor[1])
+        else:
+            hrefs.append(anchor.get("href"))
+            content.append(anchor.text)
+
+    return hrefs, content
+
+
+def parse_anchor(anchor):
+    """
+    Returns the href and content of an anchor
+
+    Parameters:
+    -------------
+    anchor: bs4 anchor object or (href, content) tuple, see extract_anchors()
+
+    Returns:
+    -------------
+    href: str - href content found in anchor
+    content: str - Content/title found in anchor
+    """
+
+    if isinstance(anchor, tuple):
+        href, content = anchor
+    else:
+        href = anchor.get("href")
+        content = anchor.text
+
+    if href == None:
+        href = ""
+
+    if content == None:
+        content = ""
+
+    return href, content
+
+
+def numeric_reference(name):
+    """
+    Decodes a numeric character reference the way html.parser hands it over
+    (the part between &# and ;), as BeautifulSoup does: invalid code points
+    become U+FFFD, C1 controls are read as windows-1252, other controls and
+    noncharacters are kept as they are, and text after the digits of an
+    unterminated reference is kept as text
+
+    Parameters:
+    -------------
+    name: str - Reference without &# and ;, e.g. '233' or 'xE9'
+
+    Returns:
+    -------------
+    text: str - Decoded character followed by any trailing text
+    """
+
+    prefix, digits = "", name
+    if name[:1] in ("x", "X"):
+        prefix, digits = "x", name[1:]
+
+    match = re.match("[0-9a-fA-F]+" if prefix else "[0-9]+", digits)
+    if match is None:
+        return digits
+
+    character = unescape(f"&#{prefix}{match.group()};")
+    if not character:
+        # Dropped by html.unescape(), kept by BeautifulSoup
+        character = chr(int(match.group(), 16 if prefix else 10))
+
+    return character + digits[match.end() :]
+
+
+class AnchorParser(HTMLParser):
+    """
+    Streaming html.parser handler that collects the href and text of every
+    anchor as the page is tokenized, without building a tree. Open tags are
+    tracked the same way BeautifulSoup's html.parser builder nests them so the
+    results match get_anchors() + parse_anchors():
+        - end tags close everything opened after the matching start tag
+        - only anchors inside the first <body> are kept (all if no <body>)
+        - text in <script>, <style> and comments is left out of anchor text
+        - character and entity references are decoded as BeautifulSoup does
+
+    e.g. parser = AnchorParser()
+         parser.feed(page)
+         parser.close()
+         parser.get_anchors()
+    """
+
+    # Tags BeautifulSoup closes as soon as they are opened
+    VOID_TAGS = {
+        "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+        "link", "menuitem", "meta", "param", "source", "track", "wbr",
+        "basefont", "bgsound", "command", "frame", "image", "isindex",
+        "nextid", "spacer",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.anchors = []  # [href, list of text, in body] per anchor
+        self.open_tags = []  # [tag, anchor or None] per open tag
+        self.open_anchors = []
+        self.body = None  # Open tag entry of the first <body>
+        self.body_closed = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID_TAGS:
+            return
+
+        anchor = None
+        if tag == "a":
+            href = None
+            for name, value in attrs:
+                if name == "href":
+                    href = value if value is not None else ""
+            in_body = self.body is not None and not self.body_closed
+            anchor = [href, [], in_body]
+            self.anchors.append(anchor)
+            self.open_anchors.append(anchor)
+
+        entry = [tag, anchor]
+        self.open_tags.append(entry)
+
+        if tag == "body" and self.body is None:
+            self.body = entry
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Close everything up to the most recent matching open tag
+        for ii in range(len(self.open_tags) - 1, -1, -1):
+            if self.open_tags[ii][0] == tag:
+                break
+        else:
+            return
+
+        closed = self.open_tags[ii:]
+        del self.open_tags[ii:]
+
+        if any(entry is self.body for entry in closed):
+            self.body_closed = True
+
+        if any(entry[1] is not None for entry in closed):
+            self.open_anchors = [
+                entry[1] for entry in self.open_tags if entry[1] is not None
+            ]
+
+    def handle_data(self, data):
+        if not self.open_anchors:
+            return
+        if self.open_tags[-1][0] in ("script", "style"):
+            return
+
+        for anchor in self.open_anchors:
+            anchor[1].append(data)
+
+    def handle_charref(self, name):
+        self.handle_data(numeric_reference(name))
+
+    def handle_entityref(self, name):
+        # Unknown entities are kept as text (without the ;) like BeautifulSoup
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        if character is None:
+            character = f"&{name}"
+
+        self.handle_data(character)
+
+    def unknown_decl(self, data):
+        # CDATA sections count as text
+        if data.startswith("CDATA["):
+            self.handle_data(data[6:])
+
+    def get_anchors(self):
+        """
+        Returns:
+        -------------
+        anchors: list of (href, content) tuples - href is None if not given
+        """
+
+        anchors = self.anchors
+        if self.body is not None:
+            anchors = [anchor for anchor in anchors if anchor[2]]
+
+        return [(href, "".join(content)) for href, content, _ in anchors]
+
+
+def stream_anchors(data):
+    """
+    Extracts the href and text of every anchor in the <body> of an html string
+    with AnchorParser, without building a BeautifulSoup tree
+
+    Parameters:
+    -------------
+    data: str - Html content of webpage
+
+    Returns:
+    -------------
+    anchors: list of (href, content) tuples - href is None if not given
+    """
+
+    parser = AnchorParser()
+    parser.feed(data)
+    parser.close()
+
+    return parser.get_anchors()
+
+
+class LxmlAnchorTarget:
+    """
+    lxml parser target that collects the href and text of every anchor in the
+    <body> from parser events, without building a tree. See lxml_anchors().
+    """
+
+    def __init__(self):
+        self.anchors = []  # [href, list of text, in body] per anchor
+        self.open_anchors = []
+        self.body_depth = 0
+        self.skip_depth = 0  # Inside <script> or <style>
+
+    def start(self, tag, attrs):
+        if tag == "body":
+            self.body_depth += 1
+        elif tag in ("script", "style"):
+            self.skip_depth += 1
+        elif tag == "a":
+            anchor = [attrs.get("href"), [], self.body_depth > 0]
+            self.anchors.append(anchor)
+            self.open_anchors.append(anchor)
+
+    def end(self, tag):
+        if tag == "body":
+            self.body_depth -= 1
+        elif tag in ("script", "style"):
+            self.skip_depth -= 1
+        elif tag == "a":
+            self.open_anchors.pop()
+
+    def data(self, data):
+        if self.skip_depth:
+            return
+
+        for anchor in self.open_anchors:
+            anchor[1].append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        anchors = [anchor for anchor in self.anchors if anchor[2]]
+        return [(href, "".join(content)) for href, content, _ in anchors]
+
+
+def lxml_anchors(data):
+    """
+    Extracts the href and text of every anchor in the <body> of an html string
+    from lxml (libxml2) parser events. Several times faster than
+    stream_anchors() and gives the same anchors on well-formed pages, but
+    libxml2 repairs broken markup (e.g. nested anchors, anchors in <head>)
+    differently from BeautifulSoup. Requires lxml, falls back to
+    stream_anchors() if lxml is not installed or cannot parse the page.
+
+    Parameters:
+    -------------
+    data: str - Html content of webpage
+
+    Returns:
+    -------------
+    anchors: list of (href, content) tuples - href is None if not given
+    """
+
+    if etree is None:
+        return stream_anchors(data)
+
+    try:
+        parser = etree.HTMLParser(target=LxmlAnchorTarget())
+        anchors = etree.fromstring(data, parser)
+    except (etree.LxmlError, ValueError):
+        return stream_anchors(data)
+
+    return anchors
+
+
+def bs4_anchors(data):
+    """
+    Extracts the href and text of every anchor in the <body> of an html string
+    with BeautifulSoup (get_anchors() + parse_anchors())
+
+    Parameters:
+    -------------
+    data: str - Html content of webpage
+
+    Returns:
+    -------------
+    anchors: list of (href, content) tuples - href is None if not given
+    """
+
+    hrefs, contents = parse_anchors(get_anchors(BeautifulSoup(data, "html.parser")))
+
+    return list(zip(hrefs, contents))
+
+
+# Backends available to extract_anchors()
+ANCHOR_BACKENDS = {
+    "stream": stream_anchors,
+    "lxml": lxml_anchors,
+    "bs4": bs4_anchors,
+}
+
+
+def extract_anchors(data, backend="stream"):
+    """
+    Extracts the href and text of every anchor in the <body> of an html string.
+    The 'stream' backend tokenizes the page without building a tree and is the
+    default, 'bs4' is kept as a fallback, and both return the same anchors.
+    The optional 'lxml' backend is faster still, see lxml_anchors().
+
+    e.g. extract_anchors('<body><a href="/news">News</a></body>')
+         returns [('/news', 'News')]
+
+    Parameters:
+    -------------
+    data: str - Html content of webpage
+    backend: str = 'stream' - Key of ANCHOR_BACKENDS
+
+    Returns:
+    -------------
+    anchors: list of (href, content) tuples - href is None if not given
+    """
+
+    return ANCHOR_BACKENDS[backend](data)
+
+
+def get_new_diff(new_data, old_data):
+    """
+    Find what is new in new_data that cannot be found in old_data
+
+    Parameters:
+    -------------
+    new_data: list - e.g. list of anchors from newly pinged webpage
+    old_data: list - e.g. list of anchors from cached webpage
 
     Returns:
     -------------
-    _datetime: datetime object - given in local timezone
-
+    diff: list - e.g. list of new anchors found
     """
 
-    local_tz = str(get_localzone())
-    _datetime = _datetime.astimezone(pytz.timezone(local_tz))
-    
-    return _datetime
+    diff = list(set(new_data) - set(old_data))
+    return diff
 
 
-def url_updated(url, since_datetime):
+def anchor_fingerprint(anchor):
     """
-    Checks if a url has been updated since a certain datetime using the
-    If-Modified-Since header
+    Short digest of an anchor's href and text with whitespace (and the case of
+    the text) normalized. Other attributes (class, style, ids) are ignored so
+    cosmetic changes to a link do not make it look new.
 
     Parameters:
     -------------
-    url: str - url being monitored
-    since_datetime: datetime object - check if changes have been made since this
-        datetime (must be in UTC/GMT)
+    anchor: bs4 anchor object or (href, content) tuple
 
     Returns:
     -------------
-    True or False - True if changes found, otherwise False
+    fingerprint: str - 16 character hex digest
     """
 
-    headers = {"If-Modified-Since": t, "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36"}
-    since_datetime = datetime_header_format(since_datetime)
-    r = requests.header(url, headers=headers)
+    href, content = parse_anchor(anchor)
+    href = " ".join(href.split())
+    content = " ".join(content.split()).lower()
 
-    status_code = r.status_code
+    fingerprint = hashlib.sha256(f"{href}\n{content}".encode("utf-8")).hexdigest()
 
-    if status_code == 200:
-        return True
-    elif status_code == 204:
-        return False
-    else:
-        print(f"Update not detected with status code {status_code}")
-        return False
+    return fingerprint[:16]
 
 
-def cache_updated(base_url, data, path="logs/"):
+def load_anchor_index(base_url, path="logs/"):
     """
-    Checks if new html data is different from old cached html data. If changes
-    found, return True, otherwise return False. If cache not found, it creates 
-    a cache of the html page and returns False.
+    Loads the fingerprints of the anchors on the last seen version of a page
 
     Parameters:
     -------------
-    base_url: str - Url of site to be cached
-    data: str - Html content of the site
-    path: str = 'logs/' - Path where CACHE to be saved
+    base_url: str - Url of site
+    path: str = 'logs/' - Path FINGERPRINTS files are located
 
     Returns:
     -------------
-    True or False - True if changes found, otherwise False (including if no 
-        cache found)
-
+    index: set of str - Anchor fingerprints, None if no index stored
     """
 
-    # Check cache exists
-    url_filename = url_to_filename(base_url)
-    filename = f"{path}CACHE-{url_filename}.html"
-    cache_exists = os.path.isfile(filename)
-
-    # Yes: Compare new html data to cached html data
-    if cache_exists:
-        # Opens cached html page
-        data_cache = load_cache(base_url, path=path)
-        f = open(filename, "r")
-        data_cache = f.read()
+    store = active_store(path)
+    if store is not None:
+        return store.load_anchor_index(base_url)
 
-        # Loads html content as BeautifulSoup object and extracts the <body>
-        soup_cache = BeautifulSoup(data_cache, "html.parser")
-        body_cache = soup_cache.find("body")
-        soup_data = BeautifulSoup(data, "html.parser")
-        body_data = soup_data.find("body")
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}FINGERPRINTS-{url_filename}.json"
 
-        # Hashes content of the new and cached body contents
-        # to make comparing more efficient
-        hash_cache = hash(str(body_cache))
-        hash_data = hash(str(body_data))
+    if not os.path.isfile(filename):
+        return None
 
-        # If cached and new data match, no updates detected, otherwise yes
-        if body_cache == body_data:
-            message = f"[{now_hms()}] No update from {base_url} \n"
-            write_log(message, base_url, path=path)
-            return False
-        else:
-            message = f"[{now_hms()}] Update detected from {base_url} \n"
-            write_log(message, base_url, path=path)
-            return True
+    with open(filename, "r") as f:
+        index = set(json.load(f))
 
-    # No: Create cache of html data
-    else:
-        message1 = f"[{now_hms()}] No cached webpage found for {base_url} \n"
-        message2 = f"[{now_hms()}] Initializing page in {filename} \n"
-        write_log(f"{message1}{message2}", base_url, path=path)
-        store_cache(base_url, data, path=path)
-        return False
+    return index
 
 
-def write_log(message: str, base_url, path="logs/"):
+def store_anchor_index(base_url, fingerprints, path="logs/"):
     """
-    Writes to a log txt file of any message you would like to record.
+    [Over]write the fingerprints of the anchors on a page
 
     Parameters:
     -------------
-    message: str - Message to be written to log
-    base_url: str - Url of site to be cached
-    path: str = 'logs/' - Path where LOG to be saved
+    base_url: str - Url of site
+    fingerprints: iterable of str - Anchor fingerprints, see anchor_fingerprint()
+    path: str = 'logs/' - Path where FINGERPRINTS to be saved
 
     Returns:
     -------------
     n/a
     """
-    print(message)
-    url_filename = url_to_filename(base_url)
-    filename = f"{path}LOG-{url_filename}.txt"
 
-    if os.path.exists(filename):
-        append_write = "a"
-    else:
-        append_write = "w"
+    store = active_store(path)
+    if store is not None:
+        store.store_anchor_index(base_url, fingerprints)
+        return
 
-    f = open(filename, append_write)
-    f.write(message)
-    f.close()
+    url_filename = url_to_filename(base_url)
+    filename = f"{path}FINGERPRINTS-{url_filename}.json"
 
+    with open(filename, "w") as f:
+        json.dump(sorted(set(fingerprints)), f)
 
-def get_anchors(html_data):
+
+def new_anchors(base_url, anchors, path="logs/", update=True, fingerprints=None):
     """
-    Takes BeautifulSoup object and searches <body> for anchors
+    Finds the anchors of a page that were not on the last seen version of it by
+    looking up their fingerprints in the page's FINGERPRINTS index, then
+    replaces the index with the fingerprints of the given anchors. Pages cached
+    before indexes were kept have their CACHE parsed once to build one.
 
     Parameters:
     -------------
-    html_data: bs4 - Html content of webpage
+    base_url: str - Url of site
+    anchors: list of bs4 or (href, content) tuples - All anchors on the newly
+        pinged page, see extract_anchors()
+    path: str = 'logs/' - Path CACHE and FINGERPRINTS files are located
+    update: bool = True - Store the fingerprints of anchors as the new index
+    fingerprints: list of str = None - anchor_fingerprint() of each anchor if
+        already computed, see analyze_page()
 
     Returns:
     -------------
-    anchors: list of bs4 - List of all anchors (including tags)
+    diff: list - New anchors, in the order they appear on the page
     """
 
-    # If html_data does not have a <body>, assume the data passed if the <body>
-    if html_data.find("body") == None:
-        html_body = html_data
-    else:
-        html_body = html_data.find("body")
+    if fingerprints is None:
+        fingerprints = [anchor_fingerprint(anchor) for anchor in anchors]
+    index = load_anchor_index(base_url, path=path)
 
-    anchors = list(html_body.find_all("a"))
+    if index is None:
+        if cache_exists(base_url, path=path):
+            old_anchors = extract_anchors(load_cache(base_url, path=path))
+            index = set(anchor_fingerprint(anchor) for anchor in old_anchors)
+        else:
+            index = set()
 
-    return anchors
+    diff = []
+    seen = set(index)
+    for anchor, fingerprint in zip(anchors, fingerprints):
+        if fingerprint not in seen:
+            diff.append(anchor)
+            seen.add(fingerprint)
 
+    if update:
+        store_anchor_index(base_url, fingerprints, path=path)
 
-def parse_anchors(anchors):
+    return diff
+
+
+def load_keywords_csv(filename: str):
     """
-    Takes list of anchors and returns the hrefs and content of each
+    Loads csv delimited by linebreaks and loads them into a list
 
     Parameters:
     -------------
-    anchors: list of bs4 - All anchors to be parsed
+    filename: str - path and filename to the csv file of keywords
 
     Returns:
     -------------
-    hrefs: list of str - All href content found in each anchor
-    contents: list of str - All content/title found in each anchor
+    keywords: list of str - list of the keywords that were in the csv
     """
-    hrefs = []
-    content = []
 
-    for anchor in anchors:
-        hrefs.append(anchor.get("href"))
-        content.append(anchor.text)
+    with open(filename, "r") as f:
+        reader = csv.reader(f, delimiter="\n")
+        kws = list(reader)
 
-    return hrefs, content
+    keywords = []
+    for keyword in kws:
+        keywords.append(keyword[0])
 
+    return keywords
 
-def get_new_diff(new_data, old_data):
+
+def find_keywords(anchor, keywords=[""]):
     """
-    Find what is new in new_data that cannot be found in old_data
+    Returns keywords found in an anchor's href or content
 
     Parameters:
     -------------
-    new_data: list - e.g. list of anchors from newly pinged webpage
-    old_data: list - e.g. list of anchors from cached webpage
+    anchor: bs4 anchor object or (href, content) tuple
+    keywords: list of str - Keywords to search for (case insensitive)
 
     Returns:
     -------------
-    diff: list - e.g. list of new anchors found
+    rel_keywords: list of str - Keywords found in the anchor
     """
 
-    diff = list(set(new_data) - set(old_data))
-    return diff
+    href, content = parse_anchor(anchor)
+    rel_keywords, _ = compile_keywords(keywords).match(href, content)
 
+    return rel_keywords
 
-def load_keywords_csv(filename: str):
+
+def relevant_anchors(anchors, keywords=[], ignorewords=[]):
     """
-    Loads csv delimited by linebreaks and loads them into a list
+    Takes a list of anchors and returns the ones that contain at least one
+    keyword and none of the ignorewords. Keywords and ignorewords are compiled
+    into one KeywordMatcher so each anchor is scanned once.
 
     Parameters:
     -------------
-    filename: str - path and filename to the csv file of keywords
+    anchors: list of bs4 or (href, content) tuples - Anchors to be checked
+    keywords: list of str - Keywords that mark an anchor as relevant
+    ignorewords: list of str - Keywords that mark an anchor as not relevant
 
     Returns:
     -------------
-    keywords: list of str - list of the keywords that were in the csv
+    rel_anchors: list - Subset of anchors that are relevant
+    rel_keywords: list of list of str - Keywords found in each relevant anchor
     """
 
-    f = open(filename, "r")
-    reader = csv.reader(f, delimiter="\n")
-    kws = list(reader)
+    matcher = compile_keywords(keywords, ignorewords)
 
-    keywords = []
-    for keyword in kws:
-        keywords.append(keyword[0])
+    rel_anchors = []
+    rel_keywords = []
 
-    return keywords
+    for anchor in anchors:
+        href, content = parse_anchor(anchor)
+        kws, iws = matcher.match(href, content)
+
+        if kws and not iws:
+            rel_anchors.append(anchor)
+            rel_keywords.append(kws)
+
+    return rel_anchors, rel_keywords
 
 
 def check_for_keywords(anchors, keywords, keywords_ignore=[""]):
@@ -396,10 +1594,8 @@ def check_for_keywords(anchors, keywords, keywords_ignore=[""]):
         in which a keyword was found
     """
 
-    # Format keywords to minimize discrepencies
-    for ii, keyword in enumerate(keywords):
-        keyword = keyword.lower()
-        keywords[ii] = keyword
+    # Format keywords to minimize discrepencies (without changing the list given)
+    keywords = [keyword.lower() for keyword in keywords]
 
     # Parse all anchors and check if any contain keywords
     # Append to rel_anchors if a match
@@ -448,38 +1644,58 @@ def check_for_keywords(anchors, keywords, keywords_ignore=[""]):
     return rel_anchors, rel_keywords_all
 
 
-def send_email_notification(message, receive_addresses, sender_creds):
+def send_email_notification(message, receive_addresses, sender_address, password=None):
     """
-    Send an email to a list of recipients and log 
-    For now, the send address must be a gmail account
-    
+    Send an email to a list of recipients, as one email addressed to all of
+    them. For now, the send address must be a gmail account.
+    To send several emails over one connection, use an EmailDispatcher.
+
+    e.g. send_email_notification(msg, emails, 'me@gmail.com', 'password')
+         send_email_notification(msg, emails, 'creds/sender_email_creds.yaml')
+
     Parameters:
     -------------
     message - String or possibly html content
     receive_addresses: list of str - email addresses of recipients
-    send_creds: str - filename of sender credentials
+    sender_address: str - full email address of sender, or filename of sender
+        credentials (YAML with username and password) if no password is given
+    password: str = None - password of sender email
 
     Returns:
     -------------
     n/a
     """
 
-    sender_address, password = get_creds(sender_creds)
-    port = 465
-    smtp_server = "smtp.gmail.com"
+    if password is None:
+        sender_address, password = get_creds(sender_address)
 
-    # Create a secure SSL context
-    context = ssl.create_default_context()
+    with EmailDispatcher(sender_address, password) as mailer:
+        mailer.send(message, receive_addresses)
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", port, context=context) as server:
-        server.login(sender_address, password)
-        for receive_address in receive_addresses:
-            server.sendmail(sender_address, receive_address, message)
+
+def read_listserv(filename):
+    with open(filename, "r") as f:
+        params = yaml.safe_load(f)
+    emails = params["emails"]
+
+    return emails
 
 
 def get_listserv(filename):
-    params = yaml.safe_load(open(filename))
-    emails = params["emails"]
+    """
+    Returns the emails listed in a YAML receiver list. The file is only parsed
+    again when it changes, see load_watched().
+
+    Parameters:
+    -------------
+    filename: str - [path and] filename to YAML with an 'emails' list
+
+    Returns:
+    -------------
+    emails: list of str - email addresses of recipients
+    """
+
+    emails = list(load_watched(filename, read_listserv))
 
     return emails
 
@@ -492,45 +1708,316 @@ def get_creds(filename):
     return username, password
 
 
-def href_to_link(href, domains=[""]):
+BASE_HREF = re.compile(r"<base\s[^>]*?href\s*=\s*[\"']?([^\"'\s>]+)", re.IGNORECASE)
+
+
+def page_base_url(data, url):
+    """
+    Finds the url relative hrefs of a page are resolved against: the page's
+    <base href> (itself resolved against url) if it has one, otherwise url.
+    Uses a string search, the page is not parsed.
+
+    e.g. page_base_url('<head><base href="/en/"></head>', 'https://www.who.int/news')
+         returns 'https://www.who.int/en/'
+
+    Parameters:
+    -------------
+    data: str - Html content of the page
+    url: str - Final url the page was fetched from (after redirects)
+
+    Returns:
+    -------------
+    base_url: str - Url to resolve the page's hrefs against
+    """
+
+    head_end = data.lower().find("<body")
+    match = BASE_HREF.search(data, 0, head_end if head_end != -1 else len(data))
+
+    if match is None:
+        return url
+
+    return urljoin(url, match.group(1))
+
+
+def resolve_href(href, base_url):
     """
-    Takes href and checks if the link is valid. If not, it will
-    cycle through a list of base_urls to see if any yield a 
+    Resolves an href against the url of the page it was found on, without
+    making any requests
+
+    e.g. resolve_href('../media/1.html', 'https://www.company.com/ir/news.html')
+         returns 'https://www.company.com/media/1.html'
+
+    Parameters:
+    -------------
+    href: str - href of an anchor
+    base_url: str - Url of the page (see page_base_url())
+
+    Returns:
+    -------------
+    link: str - Absolute link
     """
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36"
-    }
+    return urljoin(add_protocol(base_url.strip()), href.strip())
+
+
+class LinkCache:
+    """
+    Disk-backed cache of links verified by href_to_link(), so the same hrefs
+    are not probed again on every update. Entries expire after ttl seconds and
+    the least recently used entries are evicted past max_entries. Changes are
+    kept in memory until save() is called.
+
+    e.g. cache = LinkCache('logs/LINKS.json')
+         link = href_to_link(href, domains, base_url=url, verify=True, cache=cache)
+         cache.save()
+
+    Parameters:
+    -------------
+    filename: str = 'logs/LINKS.json' - JSON file the cache is kept in
+    ttl: float = 604800 - Seconds a verified link is trusted (a week)
+    max_entries: int = 10000 - Links kept before the least recently used are evicted
+    """
+
+    def __init__(self, filename="logs/LINKS.json", ttl=7 * 24 * 3600, max_entries=10000):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        # key -> [link, time verified], least recently used first
+        self.entries = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename, "r") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print(f"Ignoring corrupt link cache {filename}")
+
+    @staticmethod
+    def key(href, domains=[], base_url=None):
+        return json.dumps([href.strip(), base_url] + list(domains))
+
+    def get(self, href, domains=[], base_url=None):
+        """
+        Returns the cached link of href, None if it is missing or expired
+        """
+
+        key = self.key(href, domains, base_url)
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if entry is None or time.time() - entry[1] > self.ttl:
+                self.misses += 1
+                self.dirty = self.dirty or entry is not None
+                return None
+
+            # Move to the most recently used end
+            self.entries[key] = entry
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, href, link, domains=[], base_url=None):
+        """
+        Caches link as the verified link of href
+        """
+
+        key = self.key(href, domains, base_url)
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = [link, time.time()]
+
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+            self.dirty = True
+
+    def save(self):
+        """
+        Writes the cache to its file if it has changed
+        """
+
+        with self.lock:
+            if not self.dirty:
+                return
+
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_filename, self.filename)
+
+            self.dirty = False
+
+    def stats(self):
+        """
+        Returns the number of cached links, hits and misses
+        """
+
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def get_link_cache(path="logs/"):
+    """
+    Returns the link cache kept in path, loading it on first use
+
+    Parameters:
+    -------------
+    path: str = 'logs/' - Path where LINKS.json is saved
+
+    Returns:
+    -------------
+    cache: LinkCache
+    """
+
+    filename = f"{path}LINKS.json"
+
+    if filename not in _LINK_CACHES:
+        _LINK_CACHES[filename] = LinkCache(filename)
+
+    return _LINK_CACHES[filename]
+
+
+PROBE_TIMEOUT = 5  # Seconds to wait on each link check of href_to_link()
+
+
+def probe_link(url, session=None, timeout=PROBE_TIMEOUT):
+    """
+    Checks that a link loads without downloading it: a HEAD request, falling
+    back to a GET of the first byte for servers that do not allow HEAD
+
+    Parameters:
+    -------------
+    url: str - Link to check
+    session: requests.Session = None - Session to use, defaults to get_session()
+    timeout: float = PROBE_TIMEOUT - Seconds to wait on connecting/reading
+
+    Returns:
+    -------------
+    loads: bool - True if the link loads
+    """
+
+    if session is None:
+        session = get_session()
+
+    try:
+        r = session.head(url, timeout=timeout, allow_redirects=True)
+        if r.status_code == 200:
+            return True
+        if r.status_code not in (403, 405, 501):
+            return False
+
+        r = session.get(
+            url, headers={"Range": "bytes=0-0"}, timeout=timeout, stream=True
+        )
+        r.close()
+        return r.status_code in (200, 206)
+    except requests.RequestException:
+        print(f"{url} failed")
+        return False
+
+
+def probe_links(urls, session=None, timeout=PROBE_TIMEOUT, parallel=True):
+    """
+    Finds the first of urls that loads. In parallel mode all urls are checked
+    at once and the first that loads in the order given is returned as soon
+    as every url before it has failed; checks still waiting are cancelled.
+
+    Parameters:
+    -------------
+    urls: list of str - Links to check, in order of priority
+    session: requests.Session = None - Session to use, defaults to get_session()
+    timeout: float = PROBE_TIMEOUT - Seconds to wait on each check
+    parallel: bool = True - Check all urls at once instead of one at a time
+
+    Returns:
+    -------------
+    url: str - First of urls that loads, None if none do
+    """
+
+    if session is None:
+        session = get_session()
+
+    if not parallel or len(urls) <= 1:
+        return next((url for url in urls if probe_link(url, session, timeout)), None)
+
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    try:
+        futures = [executor.submit(probe_link, url, session, timeout) for url in urls]
+
+        for url, future in zip(urls, futures):
+            if future.result():
+                return url
+    finally:
+        # Do not wait on checks of lower priority urls
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return None
+
+
+def href_to_link(href, domains=[""], session=None, base_url=None, verify=False, cache=None, parallel=True):
+    """
+    Turns href into an absolute link. The href is resolved in memory against
+    base_url (or, if not given, the first of domains). Only with verify=True
+    are requests made: the resolved link and the href joined to each of
+    domains (over https and http) are checked, see probe_links(), and the
+    first that loads is returned.
+    Verified links are cached (see LinkCache) so they are only probed once.
+    Requests go through get_session() unless a session is given.
+
+    Parameters:
+    -------------
+    href: str - href of an anchor
+    domains: list of str = [''] - Urls the href could be relative to
+    session: requests.Session = None - Session used when verifying
+    base_url: str = None - Url of the page the href was found on (see page_base_url())
+    verify: bool = False - Check that the link loads, trying domains if not
+    cache: LinkCache = None - Cache of verified links, defaults to get_link_cache()
+    parallel: bool = True - Check candidate links at once instead of one at a time
+
+    Returns:
+    -------------
+    link: str - Absolute link (href unchanged if it cannot be resolved)
+    """
 
     href = href.strip()
 
-    if domains[0] != "":
-        domains.insert(0, "")
+    if base_url is None:
+        base_url = next((domain for domain in domains if domain.strip() != ""), None)
+
+    link = href if base_url is None else resolve_href(href, base_url)
 
-    for domain in domains:
-        temp_url = merge_link(domain, href)
-        temp_url = add_protocol(temp_url)
+    if not verify:
+        return link
 
-        if not "." in temp_url:
+    if cache is None:
+        cache = get_link_cache()
+
+    cached_link = cache.get(href, domains, base_url)
+    if cached_link is not None:
+        return cached_link
+
+    candidates = []
+    for temp_url in [link] + [add_protocol(merge_link(domain, href)) for domain in [""] + list(domains)]:
+        if not temp_url.startswith("http") or not "." in temp_url:
             continue
 
-        try:
-            r = requests.head(temp_url, headers=headers)
-            if r.status_code == 200:
-                return temp_url
-        except:
-            print(f"{temp_url} failed")
+        for candidate in (temp_url, switch_protocol(temp_url)):
+            if candidate not in candidates:
+                candidates.append(candidate)
+
+    verified_link = probe_links(candidates, session=session, parallel=parallel)
+
+    if verified_link is None:
+        return link
 
-        try:
-            print(switch_protocol(temp_url))
-            r = requests.get(switch_protocol(temp_url), headers=headers)
-            if r.status_code == 200:
-                return switch_protocol(temp_url)
-        except:
-            print(f"{switch_protocol(temp_url)} failed")
-            pass
+    cache.put(href, verified_link, domains, base_url)
 
-    return href
+    return verified_link
 
 
 def merge_link(url_domain, url_path):
@@ -629,7 +2116,7 @@ def compose_email(message_body, organization, domain, target_url, time_requested
     
     Parameters:
     -------------
-    message_body: str - full email message sans subject and headers
+    message_body: str or list of str - full email message sans subject and headers
     organization: str - name of organization
     domain: str - domain (home page) of the organization being followed
     target_url: str - exact url of the page that was being monitored
@@ -650,7 +2137,10 @@ def compose_email(message_body, organization, domain, target_url, time_requested
     email_msg.append(f'\n[{time_requested}] {organization} - {domain}')
     email_msg.append('------------------------')
 
-    email_msg.append(message_body)    
+    if isinstance(message_body, list):
+        email_msg.extend(message_body)
+    else:
+        email_msg.append(message_body)
 
     if keywords != []:
         email_msg.insert(0, f'New links related to the following keywords have been detected! \n{keywords}\n')
@@ -664,7 +2154,7 @@ def compose_email(message_body, organization, domain, target_url, time_requested
     return email_msg
 
 
-def anchors_to_message(anchors, keywords, target_url, home_url='', other_urls=[]):   
+def anchors_to_message(anchors, keywords, target_url, home_url='', other_urls=[], path="logs/", session=None, base_url=None, verify=False):
     """
     Composes body of the email from a list of relevant anchors
 
@@ -676,6 +2166,12 @@ def anchors_to_message(anchors, keywords, target_url, home_url='', other_urls=[]
     target_url: str - exact url of the page that was being monitored
     home_url: str - domain (home page) of the organization being followed
     other_urls: list of str - other URLs to check against for href_to_link
+    path: str = 'logs/' - Path where LOG to be saved
+    session: requests.Session = None - Session used by href_to_link
+    base_url: str = None - Url hrefs are resolved against (see page_base_url()),
+        defaults to target_url
+    verify: bool = False - Check each link loads, see href_to_link(). Verified
+        links are cached in path (see get_link_cache())
 
     Returns:
     -------------
@@ -692,18 +2188,27 @@ def anchors_to_message(anchors, keywords, target_url, home_url='', other_urls=[]
     else:
         home_url = target_url
 
-    url_all.extend(other_urls)
+    urls_all.extend(other_urls)
+
+    if base_url is None:
+        base_url = target_url
+
+    cache = get_link_cache(path) if verify else None
 
     for anchor, kws in zip(anchors, keywords):
         href, content = parse_anchor(anchor)
-        message=f'{content} :: {href_to_link(href, urls_all)}'
-        msg.append(message)
-        write_log(message, target_url)
-
+        link = href_to_link(href, urls_all, session=session, base_url=base_url, verify=verify, cache=cache)
         kw_list = ', '.join(kws)
-        message=f'Link marked because of keywords: {kw_list}'
-        msg.append(message)
-        write_log(message, target_url)
-        msg.append('\n----\n')    
+
+        msg.append(f'{content} :: {link}')
+        msg.append(f'Link marked because of keywords: {kw_list}')
+        msg.append('\n----\n')
+
+        # One log record per anchor
+        message = f'{msg[-3]}\n{msg[-2]}\n'
+        write_log(message, target_url, path=path, event="relevant_anchor", anchors=[(link, content)])
+
+    if cache is not None:
+        cache.save()
 
     return msg                 